@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""gridbench - How compile time and memory grow with .grid program size
+
+Generates synthetic programs at multiples of the size of tests.grid and
+compiles each, as one program, through gridc's stages (prepass -> identity
+-> semcheck -> opt -> grid -> postpass -> indent) with a fresh worker,
+recording the wall time of every stage and the peak RSS of the Python
+driver and of the node worker.
+
+Programs are built from four shapes, alone and mixed:
+  chain     long runs of := assignments, each using the one before it
+  ifnest    deeply nested If / ElseIf / Else
+  function  Define ... as Function with wide Input/Output/push bodies
+  array     cell assignments of big {.., ..; .., ..} array literals
+
+Shapes are written in the full grid language, like tests.grid.  Where the
+grammar does not cover a shape yet, the stage that rejects it is recorded
+and the stages before it are still timed.
+
+usage: gridbench.py [--scales 1,10,100,1000] [--mixes ...] [--repeat 3] [-o baseline.json]
+       gridbench.py --compare baseline.json [...]    exits 1 on a regression
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+ROOT = HERE.parent
+sys.path.insert(0, str(ROOT))
+import gridc
+
+MIXES = ["chain", "ifnest", "function", "array", "mixed"]
+SCALES = [1, 10, 100, 1000]
+
+# a stage whose time grows faster than size ** GROWTH between scales is super-linear
+GROWTH = 1.25
+# per-line cost allowed over the baseline before --compare complains
+TOLERANCE = 1.5
+# stages faster than this are too noisy to judge
+NOISE = 0.02
+
+
+def unit_lines():
+    """Size of one scale unit: the line count of tests.grid"""
+    return (ROOT / "tests.grid").read_text(encoding="utf-8").count("\n")
+
+
+def chain(rng, n):
+    lines = [f": v0 = {rng.randint(1, 99)}"]
+    for i in range(1, n):
+        lines.append(f": v{i} = v{i - 1} + {rng.randint(1, 99)} * {rng.randint(1, 9)}")
+    lines.append(f"[A1] := v{n - 1}")
+    return lines
+
+
+def ifnest(rng, depth):
+    lines = [": x = 0", "For r as Number"]
+    pad = ""
+    for d in range(depth):
+        lines.append(f"{pad}If x = {d} Then")
+        lines.append(f"{pad}  Let r = {rng.randint(1, 99)}")
+        lines.append(f"{pad}ElseIf x = {d + depth} Then")
+        lines.append(f"{pad}  Let r = {rng.randint(1, 99)}")
+        lines.append(f"{pad}Else")
+        pad += "  "
+    lines.append(f"{pad}Let r = 0")
+    for d in reversed(range(depth)):
+        pad = pad[:-2]
+        lines.append(f"{pad}End")
+    lines.append("[A1] := r")
+    return lines
+
+
+def function(rng, width, name):
+    lines = [f"Define {name} as Function"]
+    for i in range(width):
+        lines.append(f" Input n{i} as number")
+    for i in range(width):
+        lines.append(f" Output o{i} as number")
+    for i in range(width):
+        lines.append(f" push o{i} = n{i} ^ 2 + {rng.randint(1, 99)} * n{(i + 1) % width}")
+    lines.append(f"End {name}")
+    args = ", ".join(str(rng.randint(1, 9)) for _ in range(width))
+    lines.append(f"[A1] := {name}({args})")
+    return lines
+
+
+def array(rng, rows, cols):
+    body = "; ".join(", ".join(str(rng.randint(0, 999)) for _ in range(cols)) for _ in range(rows))
+    return [f"[^A1] := {{{body}}}"]
+
+
+def unit(shape, rng, k):
+    """One test-sized block of a shape, headed like the tests in tests.grid"""
+    if shape == "chain":
+        lines = chain(rng, 40)
+    elif shape == "ifnest":
+        lines = ifnest(rng, 8)
+    elif shape == "function":
+        lines = function(rng, 12, f"F{k}")
+    else:
+        lines = array(rng, 8, 16)
+    return [f"' ---- Test {k}: synthetic {shape}"] + lines + [""]
+
+
+def generate(mix, lines, seed=1):
+    """A program of about `lines` lines built from the shapes of mix"""
+    rng = random.Random(seed)
+    shapes = MIXES[:-1] if mix == "mixed" else [mix]
+    out = []
+    k = 0
+    while len(out) < lines:
+        k += 1
+        out.extend(unit(shapes[k % len(shapes)], rng, k))
+    return "\n".join(out) + "\n"
+
+
+def run_case(mix, scale, repeat):
+    """Compile one generated program, return its measurements
+
+    The worker loads each transpiler on first use, so a small program is
+    compiled first to keep module loading out of the stage times; each stage
+    then reports its best of `repeat` runs."""
+    src = generate(mix, unit_lines() * scale)
+    compiler = gridc.Compiler(ROOT, daemon=False)
+    try:
+        compiler.compile_program(generate(mix, 1))
+    except gridc.CompileError:
+        pass
+    failed = None
+    stages = {}
+    total = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        try:
+            compiler.compile_program(src)
+        except gridc.CompileError as e:
+            failed = {"stage": e.stage, "message": e.message.strip().splitlines()[0][:200]}
+        elapsed = time.perf_counter() - start
+        total = elapsed if total is None else min(total, elapsed)
+        for stage, t in compiler.timings:
+            stages[stage] = min(stages.get(stage, t), t)
+    node = compiler.worker.request(op="stats")
+    compiler.close()
+    return {
+        "mix": mix,
+        "scale": scale,
+        "lines": src.count("\n"),
+        "bytes": len(src.encode("utf-8")),
+        "setup": compiler.setup_time,
+        "stages": stages,
+        "total": total,
+        "failed": failed,
+        "python_maxrss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "node_maxrss_kb": node["maxrss"],
+    }
+
+
+def measure(mix, scale, repeat):
+    """run_case () in a process of its own, so peak RSS belongs to this case alone"""
+    result = subprocess.run(
+        [sys.executable, __file__, "--case", mix, str(scale), str(repeat)],
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    return json.loads(result.stdout)
+
+
+def node_version():
+    try:
+        return subprocess.run(["node", "--version"], capture_output=True, text=True).stdout.strip()
+    except FileNotFoundError:
+        return None
+
+
+def superlinear(results):
+    """Stages whose time grows faster than size ** GROWTH from one scale to the next"""
+    findings = []
+    for mix in sorted({r["mix"] for r in results}):
+        runs = sorted((r for r in results if r["mix"] == mix), key=lambda r: r["lines"])
+        for a, b in zip(runs, runs[1:]):
+            for stage, tb in b["stages"].items():
+                ta = a["stages"].get(stage)
+                if ta is None or max(ta, tb) < NOISE or ta <= 0:
+                    continue
+                exponent = math.log(tb / ta) / math.log(b["lines"] / a["lines"])
+                if exponent > GROWTH:
+                    findings.append(f"{mix} {stage}: {a['scale']}x -> {b['scale']}x grows as size^{exponent:.2f}")
+    return findings
+
+
+def regressions(results, baseline):
+    """Stages whose time per line is TOLERANCE times worse than in the baseline"""
+    findings = []
+    before = {(r["mix"], r["scale"]): r for r in baseline["results"]}
+    for r in results:
+        b = before.get((r["mix"], r["scale"]))
+        if b is None:
+            continue
+        for stage, t in r["stages"].items():
+            tb = b["stages"].get(stage)
+            if tb is None or max(t, tb) < NOISE:
+                continue
+            if t / r["lines"] > TOLERANCE * tb / b["lines"]:
+                findings.append(f"{r['mix']} {r['scale']}x {stage}: {tb * 1000:.1f} ms -> {t * 1000:.1f} ms")
+        if r["failed"] and not b["failed"]:
+            findings.append(f"{r['mix']} {r['scale']}x: now fails in {r['failed']['stage']}")
+    return findings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the grid compiler on synthetic programs")
+    parser.add_argument("--scales", default=",".join(map(str, SCALES)),
+                        help="comma separated multiples of the size of tests.grid")
+    parser.add_argument("--mixes", default=",".join(MIXES), help="comma separated, from " + ", ".join(MIXES))
+    parser.add_argument("--repeat", type=int, default=3, help="compile each program this many times, keep the best")
+    parser.add_argument("-o", "--output", default=str(HERE / "baseline.json"), help="where to write the results")
+    parser.add_argument("--compare", metavar="BASELINE", help="compare against an earlier run instead of writing one")
+    parser.add_argument("--generate", nargs=2, metavar=("MIX", "SCALE"), help="print a generated program and exit")
+    parser.add_argument("--case", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        print(json.dumps(run_case(args.case[0], int(args.case[1]), int(args.case[2]))))
+        return
+    if args.generate:
+        sys.stdout.write(generate(args.generate[0], unit_lines() * int(args.generate[1])))
+        return
+
+    mixes = args.mixes.split(",")
+    scales = [int(s) for s in args.scales.split(",")]
+    results = []
+    for mix in mixes:
+        for scale in scales:
+            r = measure(mix, scale, args.repeat)
+            results.append(r)
+            status = f"fails in {r['failed']['stage']}" if r["failed"] else "ok"
+            print(f"{mix:<9} {scale:>5}x {r['lines']:>9} lines {r['total'] * 1000:10.1f} ms "
+                  f"node {r['node_maxrss_kb'] // 1024:>5} MB  {status}", file=sys.stderr)
+
+    findings = superlinear(results)
+    if args.compare:
+        findings += regressions(results, json.loads(Path(args.compare).read_text()))
+    else:
+        run = {
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "machine": {"platform": platform.platform(), "python": platform.python_version(),
+                        "node": node_version(), "cpus": os.cpu_count()},
+            "unit_lines": unit_lines(),
+            "results": results,
+        }
+        Path(args.output).write_text(json.dumps(run, indent=2) + "\n")
+        print(f"wrote {args.output}", file=sys.stderr)
+    for finding in findings:
+        print(f"REGRESSION {finding}", file=sys.stderr)
+    if findings and args.compare:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+"""
+GridLang compiler front end for test_runner.py.
+Compiles grid source with gridc.py and runs the result through gridrun.py's bytecode cache.
+"""
+import gridc
+import gridrun
+
+
+class GridLangCompiler:
+    """Compiles and runs grid programs, reusing one worker and one bytecode cache."""
+
+    def __init__(self, pbpwd=gridc.HERE):
+        self.compiler = gridc.Compiler(pbpwd)
+        self.bytecode = gridrun.BytecodeCache(pbpwd)
+
+    def compile(self, code):
+        """Return the Python emitted for grid source code."""
+        return self.compiler.compile(code if code.endswith("\n") else code + "\n")
+
+    def run(self, code, args=None):
+        """Compile and run grid source code, return its cells as {name: value}.
+
+        args are the values of its top-level Input statements, in order."""
+        namespace = self.bytecode.run(self.compile(code), "<grid>", args or ())
+        return namespace["rtlib"].export(namespace["subject"])
+
+    def truncate_output(self, value, limit=200):
+        """repr of value, cut to limit characters for the debug log."""
+        text = repr(value)
+        if len(text) <= limit:
+            return text
+        return text[:limit - 3] + "..."
+
+    def close(self):
+        self.compiler.close()
@@ -0,0 +1,531 @@
+#!/usr/bin/env python3
+"""gridc - Compile a .grid program to Python in one process
+
+Runs prepass -> grid-identity -> grid-semcheck -> grid-opt -> grid -> postpass -> indent
+as an in-memory pipeline.  Every t2t stage is served by one t2t worker (the
+project's daemon if it is running, else a private one), so each grammar is
+compiled once and the text passes between stages as Python strings.
+
+A "' ---- Test N:" header comment starts a new program: a file holding
+many of them (tests.grid) is that many independent programs, each with its
+own frame of slots, its own schedule and its own cycle check, and a block
+sees neither the names of the blocks before it nor anything after it (only
+cells they have already computed).  compile () and compile_sharded () both
+compile such a file block by block, so they emit the same Python; with
+--incremental only the blocks whose text changed go through the t2t stages
+again, and with --jobs N the blocks that need compiling are spread over N
+processes.  --stream, --watch and --ir take the file as one program, as
+Compiler.compile_program () does.
+
+With --stream the source is read, compiled and written a chunk at a time,
+see compile_stream ().  --watch keeps recompiling the source into -o OUT
+whenever it changes, see watch ().
+
+Variables are resolved to fixed slots at compile time: the emitted Python
+reads and writes slots [i] of a flat list that rtlib.frame () sets up, and
+the names only survive as a debug table.  Writes to a name declared "as
+number" are checked at run time (rtlib.check ()) only where the type of the
+value cannot be inferred at compile time.
+
+Top-level definitions, cell assignments and Returns are emitted as nodes
+of a dependency graph (rtlib.formula (), cell (), effect ()) with the slots
+they read, and rtlib.recalc () evaluates them in topological order at the
+end of each program.
+
+With --ir the output is the compact instruction list of grid-ir.rwr, which
+rtlib.runir () executes without the indenter or a Python parse.
+
+usage: gridc.py [--times] [--incremental] [--jobs N] [--stream] [--intermediate DIR] [-o OUT] file.grid
+       gridc.py --ir [--times] [-o OUT.gir] file.grid
+       gridc.py --watch -o OUT file.grid
+"""
+
+import argparse
+import hashlib
+import os
+import re
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+PBP = Path(os.environ.get("PBP", HERE / "pbp"))
+sys.path.insert(0, str(PBP))
+import t2tcache
+import t2tworker
+
+
+class Stage:
+    """One t2t pass: a grammar and the rewrite applied to it
+
+    memo names the rules whose rewrite depends only on their own subtree,
+    which lets watch () reuse it for every statement an edit did not touch."""
+
+    def __init__(self, name, grammar, rewrite, memo=()):
+        self.name = name
+        self.grammar = grammar
+        self.rewrite = rewrite
+        self.memo = memo
+
+
+# the prepass numbers lines with a counter in support.mjs, so its output
+# for a piece of text depends on everything ahead of it
+STATEMENTS = ("TopLevelStatement",)
+
+STAGES = [
+    Stage("prepass", "prepass", "prepass"),
+    Stage("identity", "grid", "grid-identity", STATEMENTS),
+    Stage("semcheck", "grid", "grid-semcheck", STATEMENTS),
+    Stage("opt", "grid", "grid-opt", STATEMENTS),
+    # slot numbers, read sets and types are left as markers that pyframe ()
+    # (support.mjs) settles for the whole Program, see there
+    Stage("grid", "grid", "grid", STATEMENTS),
+    Stage("postpass", "postpass", "postpass"),
+]
+
+# the compact IR backend, see grid-ir.rwr and rtlib.loadir (); its output
+# needs neither the postpass nor the indenter
+IR_STAGES = STAGES[:4] + [Stage("ir", "grid", "grid-ir")]
+
+
+# the grid stage is the last one whose output depends on the program's
+# structure, everything after it works character by character
+FRONT = ["prepass", "identity", "semcheck", "opt", "grid"]
+
+# what the Program rule of grid.rwr emits ahead of the first statement
+# (prelude () in support.mjs)
+PRELUDE = "\nimport rtlib\nsubject = rtlib.fresh ()"
+
+HEADER = re.compile(r"^'\s*-+\s*Test\s+\d+\s*:", re.MULTILINE)
+LINE_MARKER = re.compile(r"⎩(\d+)⎭")
+
+
+def split_blocks(src):
+    """Cut src in front of every test header; the pieces concatenate back to src"""
+    cuts = [m.start() for m in HEADER.finditer(src)]
+    if not cuts or cuts[0] != 0:
+        cuts.insert(0, 0)
+    cuts.append(len(src))
+    return [src[a:b] for a, b in zip(cuts, cuts[1:]) if a < b]
+
+
+def renumber(text, offset):
+    """Shift the prepass line markers ⎩N⎭ of a block compiled on its own"""
+    if offset == 0:
+        return text
+    return LINE_MARKER.sub(lambda m: f"⎩{int(m.group(1)) + offset}⎭", text)
+
+
+class CompileError(Exception):
+    def __init__(self, stage, message):
+        super().__init__(stage, message)
+        self.stage = stage
+        self.message = message
+
+    def __str__(self):
+        return f"{self.stage}: {self.message}"
+
+
+class Indenter:
+    """pbp/tas/indenter.mjs - turn ⤷ ... ⤶ bracketing into Python indentation
+
+    Text may be fed in pieces; lines are reindented as soon as they are complete."""
+
+    def __init__(self):
+        self.indentation = []
+        self.partial = ''
+        self.empty = True
+
+    def line(self, line):
+        s = line.strip()
+        opens = s.count('⤷')
+        closes = s.count('⤶')
+        r = '\n' + ''.join(self.indentation) + s.replace('⤷', '').replace('⤶', '')
+        diff = opens - closes
+        while diff > 0:
+            self.indentation.append('    ')
+            diff -= 1
+        # an unbalanced ⤶ is ignored, as indenter.mjs does
+        while diff < 0:
+            if self.indentation:
+                self.indentation.pop()
+            diff += 1
+        return r
+
+    def feed(self, text):
+        if text:
+            self.empty = False
+        lines = (self.partial + text).split('\n')
+        self.partial = lines.pop()
+        return ''.join(self.line(line) for line in lines)
+
+    def close(self):
+        if self.empty:
+            return ''
+        return self.line(self.partial)
+
+
+def indent(text):
+    indenter = Indenter()
+    return indenter.feed(text) + indenter.close()
+
+
+def top_level_statements(python):
+    """Split Python text at every line that starts in column 0"""
+    statements = []
+    for line in python.split('\n'):
+        if line and not line[0].isspace() or not statements:
+            statements.append(line)
+        else:
+            statements[-1] += '\n' + line
+    return statements
+
+
+class Compiler:
+    """Holds a worker and the transpilers of every stage across compilations"""
+
+    def __init__(self, pbpwd=HERE, pbp=PBP, stages=STAGES, daemon=True):
+        self.pbpwd = Path(pbpwd)
+        self.pbp = Path(pbp)
+        self.stages = stages
+        self.timings = []
+        start = time.perf_counter()
+        self.worker = None
+        if daemon:
+            self.worker = t2tworker.connect(self.pbpwd)
+        if self.worker is None:
+            self.worker = t2tworker.Worker(self.pbpwd, self.pbp)
+        self.transpilers = {}
+        for stage in stages:
+            self.transpilers[stage.name] = t2tcache.transpiler(
+                self.pbpwd / f"{stage.grammar}.ohm",
+                self.pbpwd / f"{stage.rewrite}.rwr",
+                self.pbpwd,
+                self.pbp
+            )
+        self.setup_time = time.perf_counter() - start
+        self.blocks = None
+
+    def run_stage(self, stage, text):
+        try:
+            # console.log () in the command line transpiler ends its output
+            # with a newline, which the next stage of a pipe sees as input
+            return self.worker.transform(self.transpilers[stage.name], text) + '\n'
+        except t2tworker.WorkerError as e:
+            raise CompileError(stage.name, str(e))
+
+    def compile(self, src, dump=None):
+        """Return the Python text for src; dump (stage, text) sees every intermediate
+
+        A src of several test blocks is several programs, compiled one block
+        at a time by compile_sharded ()."""
+        if self.stages[-1].name != "ir" and len(split_blocks(src)) > 1:
+            return self.compile_sharded(src, dump, incremental=False)
+        return self.compile_program(src, dump)
+
+    def compile_program(self, src, dump=None):
+        """Like compile (), but all of src is one program, whatever its headers"""
+        self.timings = []
+        text = src
+        for stage in self.stages:
+            start = time.perf_counter()
+            text = self.run_stage(stage, text)
+            self.timings.append((stage.name, time.perf_counter() - start))
+            if dump:
+                dump(stage.name, text)
+        if self.stages[-1].name == "ir":
+            return text
+        start = time.perf_counter()
+        text = indent(text) + '\n'
+        self.timings.append(("indent", time.perf_counter() - start))
+        if dump:
+            dump("indent", text)
+        return text
+
+    def compile_block(self, block):
+        """Front stages for one block, as if it were a file of its own"""
+        text = block
+        for stage in self.stages:
+            if stage.name in FRONT:
+                text = self.run_stage(stage, text)
+        if not text.startswith(PRELUDE):
+            raise CompileError("grid", "output does not start with the Program prelude of grid.rwr")
+        # drop the prelude and the newline console.log () added
+        return text[len(PRELUDE):-1]
+
+    def compile_sharded(self, src, dump=None, incremental=True, jobs=1):
+        """Compile src one block at a time, every block a program of its own
+
+        Every block is compiled with line numbers starting at 1.  The result
+        is shifted by the number of lines ahead of the block, so the ⎩N⎭
+        markers (and the #N comments made from them) are the same as when
+        compiling the whole file.  When incremental, the front-stage output
+        of a block is cached under a hash of its text and of the front-stage
+        transpilers, and only blocks missing from the cache are compiled.
+        With jobs > 1 those are compiled by a pool of processes, each with
+        its own worker."""
+        self.timings = []
+        start = time.perf_counter()
+        cached = t2tcache.cache_dir(self.pbpwd) / "blocks"
+        cached.mkdir(exist_ok=True)
+        fingerprint = "".join(self.transpilers[name].name for name in FRONT if name in self.transpilers)
+        blocks = split_blocks(src)
+        offsets = []
+        offset = 0
+        for block in blocks:
+            offsets.append(offset)
+            offset += block.count("\n")
+        keys = [hashlib.sha256((fingerprint + "\0" + block).encode()).hexdigest() for block in blocks]
+        bodies = [None] * len(blocks)
+        if incremental:
+            for i, key in enumerate(keys):
+                entry = cached / f"{key}.grid"
+                if entry.exists():
+                    bodies[i] = entry.read_text(encoding="utf-8")
+        todo = [i for i, body in enumerate(bodies) if body is None]
+        if jobs > 1 and len(todo) > 1:
+            with ProcessPoolExecutor(max_workers=min(jobs, len(todo)), initializer=start_shard,
+                                     initargs=(self.pbpwd, self.pbp, self.stages)) as pool:
+                results = list(pool.map(compile_shard, [blocks[i] for i in todo],
+                                        chunksize=max(1, len(todo) // (jobs * 4))))
+        else:
+            results = [compile_shard(blocks[i], self) for i in todo]
+        for i, (body, error) in zip(todo, results):
+            if error:
+                stage, message = error
+                raise CompileError(stage, renumber(message, offsets[i]))
+            bodies[i] = body
+            if incremental:
+                partial = cached / f"{keys[i]}.{os.getpid()}.partial"
+                partial.write_text(body, encoding="utf-8")
+                os.replace(partial, cached / f"{keys[i]}.grid")
+        recompiled = len(todo)
+        pieces = [renumber(body, offset) for body, offset in zip(bodies, offsets)]
+        self.blocks = (recompiled, len(blocks))
+        text = PRELUDE + "".join(pieces) + "\n"
+        self.timings.append(("blocks", time.perf_counter() - start))
+        if dump:
+            dump("grid", text)
+        for stage in self.stages:
+            if stage.name not in FRONT:
+                start = time.perf_counter()
+                text = self.run_stage(stage, text)
+                self.timings.append((stage.name, time.perf_counter() - start))
+                if dump:
+                    dump(stage.name, text)
+        start = time.perf_counter()
+        text = indent(text) + '\n'
+        self.timings.append(("indent", time.perf_counter() - start))
+        if dump:
+            dump("indent", text)
+        return text
+
+    def compile_stream(self, infile, outfile, chunk=t2tworker.CHUNK):
+        """Compile infile to outfile with memory bounded by the chunk size
+
+        Every stage is a t2tworker.Stream fed by the one before it, so output
+        is written while input is still being read.  Needs a private worker
+        (daemon=False): the streams keep transpiler state between requests."""
+        self.timings = []
+        streams = []
+        for stage in self.stages:
+            boundary = t2tworker.source_boundary() if stage.name == "prepass" else t2tworker.eol_boundary()
+            streams.append((stage.name, t2tworker.Stream(self.worker, self.transpilers[stage.name], boundary, chunk)))
+        indenter = Indenter()
+        elapsed = dict.fromkeys([name for name, _ in streams] + ["indent"], 0.0)
+
+        def push(text, final):
+            for name, stream in streams:
+                start = time.perf_counter()
+                try:
+                    if final:
+                        text = stream.feed(text) + stream.close()
+                    elif text:
+                        text = stream.feed(text)
+                except t2tworker.WorkerError as e:
+                    raise CompileError(name, str(e))
+                elapsed[name] += time.perf_counter() - start
+            start = time.perf_counter()
+            text = indenter.feed(text)
+            if final:
+                text += indenter.close() + '\n'
+            elapsed["indent"] += time.perf_counter() - start
+            outfile.write(text)
+
+        while True:
+            text = infile.read(chunk)
+            if not text:
+                break
+            push(text, final=False)
+        push("", final=True)
+        self.timings = list(elapsed.items())
+
+    def watch(self, source, output, interval=0.2, log=sys.stderr):
+        """Recompile source into output every time it changes, until interrupted
+
+        Each stage is a t2tworker.Session: the worker keeps an ohm matcher
+        per stage and is sent only the range that changed, so ohm re-matches
+        just that region, and the grid stages rewrite only the top-level
+        statements whose subtree changed.  An edit that adds or removes lines
+        renumbers the ⎩N⎭ markers behind it, which the grid stages then see
+        as changed too; editing within a line (a cell formula) stays local.
+        Needs a private worker (daemon=False), sessions are per worker."""
+        source = Path(source)
+        sessions = [(stage, t2tworker.Session(self.worker, stage.name, self.transpilers[stage.name], stage.memo))
+                    for stage in self.stages]
+        grid = [session for stage, session in sessions if stage.name == "grid"]
+        previous = []
+        python = None
+        mtime = None
+        while True:
+            try:
+                m = source.stat().st_mtime_ns
+            except FileNotFoundError:
+                m = None
+            if m is not None and m != mtime:
+                mtime = m
+                start = time.perf_counter()
+                text = source.read_text(encoding="utf-8")
+                try:
+                    for stage, session in sessions:
+                        try:
+                            text = session.update(text) + '\n'
+                        except t2tworker.WorkerError as e:
+                            raise CompileError(stage.name, str(e))
+                except CompileError as e:
+                    print(f"{source.name}: {e.message}", file=log)
+                else:
+                    emitted = indent(text) + '\n'
+                    if emitted != python:
+                        python = emitted
+                        Path(output).write_text(python, encoding="utf-8")
+                    statements = top_level_statements(python)
+                    changed = sum((Counter(statements) - Counter(previous)).values())
+                    previous = statements
+                    elapsed = (time.perf_counter() - start) * 1000
+                    line = f"{source.name}: {elapsed:.1f} ms, re-emitted {changed} of {len(statements)} top-level statements"
+                    if grid:
+                        line += f" (grid stage rewrote {grid[0].rewritten}, reused {grid[0].reused})"
+                    print(line, file=log)
+            time.sleep(interval)
+
+    def report(self, out=sys.stderr):
+        total = self.setup_time + sum(t for _, t in self.timings)
+        print(f"  {'setup':<10} {self.setup_time * 1000:9.1f} ms", file=out)
+        for name, t in self.timings:
+            print(f"  {name:<10} {t * 1000:9.1f} ms", file=out)
+        print(f"  {'total':<10} {total * 1000:9.1f} ms", file=out)
+        if self.blocks:
+            print(f"  recompiled {self.blocks[0]} of {self.blocks[1]} blocks", file=out)
+
+    def close(self):
+        self.worker.close()
+
+
+# one Compiler per pool process, made by start_shard ()
+shard_compiler = None
+
+
+def start_shard(pbpwd, pbp, stages):
+    global shard_compiler
+    # a daemon serves one request at a time, every process needs a worker of its own
+    shard_compiler = Compiler(pbpwd, pbp, stages, daemon=False)
+
+
+def compile_shard(block, compiler=None):
+    """Return (front-stage output, None) or (None, (stage, message))"""
+    try:
+        return (compiler or shard_compiler).compile_block(block), None
+    except CompileError as e:
+        return None, (e.stage, e.message)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile a .grid program to Python")
+    parser.add_argument("source", help=".grid file, - for stdin")
+    parser.add_argument("-o", "--output", help="write the Python program here instead of stdout")
+    parser.add_argument("--times", action="store_true", help="report per-stage wall time on stderr")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only recompile the ' ---- Test N: blocks that changed since the last run")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="compile ' ---- Test N: blocks in this many processes (0: one per CPU)")
+    parser.add_argument("--stream", action="store_true",
+                        help="read, compile and write chunk by chunk, for sources too large for memory")
+    parser.add_argument("--watch", action="store_true",
+                        help="recompile into -o OUT whenever the source changes, until interrupted")
+    parser.add_argument("--ir", action="store_true",
+                        help="emit the compact IR of grid-ir.rwr (run with gridrun.py) instead of Python")
+    parser.add_argument("--intermediate", metavar="DIR",
+                        help="write the output of every stage to DIR/<source>-<stage>.grid")
+    args = parser.parse_args()
+
+    pbpwd = Path(os.environ.get("PBPWD", HERE))
+    if args.ir and (args.watch or args.stream or args.incremental or args.jobs != 1):
+        parser.error("--ir compiles whole files only, it cannot be combined with --watch, --stream, --incremental or --jobs")
+    if args.watch:
+        if not args.output or args.source == "-":
+            parser.error("--watch needs a source file and -o OUT")
+        compiler = Compiler(pbpwd, daemon=False)
+        try:
+            compiler.watch(args.source, args.output)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            compiler.close()
+        return
+
+    if args.stream:
+        compiler = Compiler(pbpwd, daemon=False)
+        infile = sys.stdin if args.source == "-" else open(args.source, encoding="utf-8")
+        outfile = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+        try:
+            compiler.compile_stream(infile, outfile)
+        except CompileError as e:
+            print(e.message, file=sys.stderr)
+            sys.exit(1)
+        finally:
+            compiler.close()
+            if args.times:
+                print(f"gridc {args.source} (stream)", file=sys.stderr)
+                compiler.report()
+        return
+
+    if args.source == "-":
+        src, base = sys.stdin.read(), "stdin"
+    else:
+        src, base = Path(args.source).read_text(encoding="utf-8"), Path(args.source).stem
+
+    dump = None
+    if args.intermediate:
+        d = Path(args.intermediate)
+        d.mkdir(parents=True, exist_ok=True)
+
+        def dump(stage, text):
+            (d / f"{base}-{stage}.grid").write_text(text, encoding="utf-8")
+
+    compiler = Compiler(pbpwd, stages=IR_STAGES if args.ir else STAGES)
+    try:
+        jobs = args.jobs or os.cpu_count() or 1
+        if args.incremental or jobs > 1:
+            python = compiler.compile_sharded(src, dump, incremental=args.incremental, jobs=jobs)
+        else:
+            python = compiler.compile(src, dump)
+    except CompileError as e:
+        print(e.message, file=sys.stderr)
+        sys.exit(1)
+    finally:
+        compiler.close()
+        if args.times:
+            print(f"gridc {base}", file=sys.stderr)
+            compiler.report()
+
+    if args.output:
+        Path(args.output).write_text(python, encoding="utf-8")
+    else:
+        sys.stdout.write(python)
+
+
+if __name__ == "__main__":
+    main()
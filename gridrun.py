@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""gridrun - Run Python emitted by gridc.py, keeping its compiled bytecode
+
+Compiling the emitted text to a code object costs as much as running most
+grid programs, so code objects are marshalled to .t2tcache/bytecode/ under a
+hash of the Python source, the source of rtlib.py and the interpreter's
+bytecode magic number, and loaded from there on later runs.  Editing the
+program, changing rtlib or switching Python versions misses the cache;
+nothing ever has to be invalidated by hand.
+
+A .gir file (gridc.py --ir) is handed to rtlib.runir () instead.
+
+usage: gridrun.py file.py|file.gir [input ...]
+"""
+
+import hashlib
+import importlib.util
+import marshal
+import os
+import sys
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+CACHE_DIRNAME = ".t2tcache"
+BYTECODE_DIRNAME = "bytecode"
+
+_rtlib_hash = None
+
+
+def rtlib_version():
+    """Hash of the rtlib.py the emitted code will import"""
+    global _rtlib_hash
+    if _rtlib_hash is None:
+        spec = importlib.util.find_spec("rtlib")
+        _rtlib_hash = hashlib.sha256(Path(spec.origin).read_bytes()).hexdigest()
+    return _rtlib_hash
+
+
+def bytecode_key(python):
+    h = hashlib.sha256(importlib.util.MAGIC_NUMBER)
+    h.update(rtlib_version().encode())
+    h.update(b"\0")
+    h.update(python.encode("utf-8"))
+    return h.hexdigest()
+
+
+class BytecodeCache:
+    """Code objects for emitted Python, in memory and on disk"""
+
+    def __init__(self, pbpwd=HERE):
+        self.dir = Path(pbpwd) / CACHE_DIRNAME / BYTECODE_DIRNAME
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.loaded = {}
+        self.hits = 0
+        self.misses = 0
+
+    def code(self, python, filename="<grid>"):
+        """Return the code object for python, compiling it only on a cache miss"""
+        key = bytecode_key(python)
+        code = self.loaded.get(key)
+        if code is not None:
+            self.hits += 1
+            return code
+        path = self.dir / f"{key}.marshal"
+        try:
+            code = marshal.loads(path.read_bytes())
+            self.hits += 1
+        except (OSError, EOFError, ValueError, TypeError):
+            code = compile(python, filename, "exec")
+            # concurrent runs of the same program each write a private file
+            partial = path.with_name(f"{path.name}.{os.getpid()}.partial")
+            partial.write_bytes(marshal.dumps(code))
+            os.replace(partial, path)
+            self.misses += 1
+        self.loaded[key] = code
+        return code
+
+    def run(self, python, filename="<grid>", arguments=()):
+        """Execute emitted Python, return the namespace it ran in"""
+        import rtlib
+        rtlib.arguments = list(arguments)
+        namespace = {"__name__": "__main__", "__file__": filename}
+        exec(self.code(python, filename), namespace)
+        return namespace
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(f"Usage: {sys.argv[0]} file.py|file.gir [input ...]", file=sys.stderr)
+        sys.exit(1)
+    path = Path(sys.argv[1])
+    # emitted code does "import rtlib", which lives next to it
+    sys.path.insert(0, str(path.resolve().parent))
+    if path.suffix == ".gir":
+        import rtlib
+        rtlib.arguments = sys.argv[2:]
+        rtlib.runir(path.read_text(encoding="utf-8"))
+        return
+    BytecodeCache().run(path.read_text(encoding="utf-8"), str(path), sys.argv[2:])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""t2tcache - Content-addressed cache of assembled t2t transpilers
+
+A transpiler is the concatenation of the t2td lib parts, the escaped grammar,
+the project's support.mjs and the rewrite module generated by rwr.mjs.  It
+depends only on the contents of those files, so it is stored under a hash of
+them in ${PBPWD}/.t2tcache/ and reused until one of them changes.
+
+The cache lives inside the project directory on purpose: node resolves
+`import 'ohm-js'` relative to the generated file, so it must be able to walk
+up to the project's node_modules.
+"""
+
+import hashlib
+import os
+import subprocess
+from collections import Counter
+from pathlib import Path
+
+CACHE_DIRNAME = ".t2tcache"
+STATS_FILENAME = "stats.log"
+
+LIB_PARTS = ["front.part.js", "middle.part.js", "args.part.js", "tail.part.js", "rwr.mjs"]
+
+
+def cache_dir(pbpwd):
+    """Return the cache directory for a project, creating it if needed"""
+    d = Path(pbpwd) / CACHE_DIRNAME
+    d.mkdir(exist_ok=True)
+    return d
+
+
+def transpiler_key(grammar, rewrite, wsupport, t2tlibd):
+    """Hash every input that contributes to the assembled transpiler"""
+    h = hashlib.sha256()
+    inputs = [grammar, rewrite, wsupport] + [t2tlibd / part for part in LIB_PARTS]
+    for path in inputs:
+        h.update(str(path.name).encode())
+        h.update(b"\0")
+        if path.exists():
+            h.update(path.read_bytes())
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def assemble(grammar, rewrite, wsupport, t2tlibd):
+    """Generate the rewrite module and concatenate all parts into one script"""
+    # Step 1: Run rwr.mjs to generate the rewrite module
+    rwr_script = t2tlibd / "rwr.mjs"
+    rewrite_output = subprocess.run(
+        ["node", str(rwr_script), str(rewrite)],
+        capture_output=True,
+        text=True,
+        check=True
+    ).stdout
+
+    # Step 2: Escape backticks in the grammar so that it is safe to embed
+    # in a JavaScript String.raw template literal
+    # (sed -e 's/`/` + "`" + String.raw`/g')
+    processed_grammar = grammar.read_text().replace('`', '` + "`" + String.raw`')
+
+    # Step 3: Concatenate all parts
+    parts = [
+        (t2tlibd / "front.part.js", None),
+        (None, processed_grammar),
+        (t2tlibd / "middle.part.js", None),
+        (t2tlibd / "args.part.js", None),
+        (wsupport, None),
+        (None, rewrite_output),
+        (t2tlibd / "tail.part.js", None)
+    ]
+    combined_content = []
+    for path, text in parts:
+        if path is None:
+            combined_content.append(text)
+        elif path.exists():
+            combined_content.append(path.read_text())
+        else:
+            raise FileNotFoundError(path)
+    return ''.join(combined_content)
+
+
+def transpiler(grammar, rewrite, pbpwd, pbp):
+    """Return the path of the assembled transpiler, building it on a cache miss"""
+    pbpwd = Path(pbpwd)
+    t2tlibd = Path(pbp) / "t2td" / "lib"
+    wsupport = pbpwd / "support.mjs"
+    d = cache_dir(pbpwd)
+    key = transpiler_key(grammar, rewrite, wsupport, t2tlibd)
+    target = d / f"{key}.nanodsl.mjs"
+    if target.exists():
+        record(d, "hit", key, grammar, rewrite)
+        return target
+    content = assemble(grammar, rewrite, wsupport, t2tlibd)
+    # several t2t stages of one pipeline may miss on the same key at once,
+    # write to a private name and rename so readers never see a partial file
+    partial = d / f"{key}.{os.getpid()}.partial"
+    partial.write_text(content)
+    os.replace(partial, target)
+    record(d, "miss", key, grammar, rewrite)
+    return target
+
+
+def record(d, outcome, key, grammar, rewrite):
+    """Append one lookup to the stats log (single short appends do not interleave)"""
+    line = f"{outcome} {key[:12]} {grammar.stem} {rewrite.stem}\n"
+    with open(d / STATS_FILENAME, "a") as f:
+        f.write(line)
+
+
+def stats(pbpwd):
+    """Summarize the stats log as a printable report"""
+    log = Path(pbpwd) / CACHE_DIRNAME / STATS_FILENAME
+    if not log.exists():
+        return "t2t cache: no lookups recorded"
+    totals = Counter()
+    per_pair = {}
+    for line in log.read_text().splitlines():
+        fields = line.split()
+        if len(fields) != 4:
+            continue
+        outcome, _key, grammar, rewrite = fields
+        totals[outcome] += 1
+        per_pair.setdefault(f"{grammar} {rewrite}", Counter())[outcome] += 1
+    lookups = totals["hit"] + totals["miss"]
+    ratio = 100.0 * totals["hit"] / lookups if lookups else 0.0
+    entries = len(list((Path(pbpwd) / CACHE_DIRNAME).glob("*.nanodsl.mjs")))
+    lines = [f"t2t cache: {lookups} lookups, {totals['hit']} hits, {totals['miss']} misses ({ratio:.1f}% hit), {entries} entries"]
+    for pair in sorted(per_pair):
+        c = per_pair[pair]
+        lines.append(f"  {pair:<32} hits {c['hit']:>6}  misses {c['miss']:>6}")
+    return "\n".join(lines)
@@ -1,4 +1,5 @@
 import * as fs from 'fs';
+import { fileURLToPath } from 'url';
 
 let terminated = false;
 
@@ -11,7 +12,7 @@ function xcontinue () {
     terminated = false;
     return '';
 }
-    
+
 function is_terminated () {
     return terminated;
 }
@@ -19,7 +20,10 @@ function expand (src, parser) {
     let cst = parser.match (src);
     if (cst.failed ()) {
 	//th  row Error (`${cst.message}\ngrammar=${grammarname (grammar)}\nsrc=\n${src}`);
-	throw Error (cst.message);
+	let e = Error (cst.message);
+	e.parseFailure = true;
+	e.position = cst.getRightmostFailurePosition ();
+	throw e;
     }
     let sem = parser.createSemantics ();
     sem.addOperation ('rwr', _rewrite);
@@ -31,28 +35,118 @@ function grammarname (s) {
     return s.substr (0, n).replaceAll (/\n/g,'').trim ();
 }
 
-try {
-    const argv = process.argv.slice(2);
-    let srcFilename = argv[0];
-    if ('-' == srcFilename) { srcFilename = 0 }
-    let src = fs.readFileSync(srcFilename, 'utf-8');
+// the same script is both run from the command line (by t2t) and imported
+// by the t2t worker (worker.mjs), which compiles the grammar once and calls
+// transform () for every request
+
+let compiled = null;
+function t2t_parser () {
+    if (compiled == null) {
+	compiled = ohm.grammar (grammar);
+    }
+    return compiled;
+}
+
+function t2t_name () {
+    return grammarname (grammar);
+}
+
+// support.mjs may keep state across rules (e.g. a line counter), give it a
+// chance to start over for each independent input
+function t2t_reset () {
+    resetArgs ();
+    if (typeof resetsupport === 'function') {
+	resetsupport ();
+    }
+}
+
+function t2t_transform (src) {
+    let p = t2t_parser ();
+    let s = src;
+    xcontinue ();
+    while (! is_terminated ()) {
+	xbreak ();
+	s = expand (s, p);
+    }
+    return s;
+}
+
+// rewrite a match result that the caller obtained itself, e.g. from an
+// incremental ohm matcher (worker.mjs sessions); the output of every rule
+// named in memo (and of its _cases) is cached per CST node, so statements
+// whose subtree survived an edit are not rewritten again; only sound for
+// rewrites whose output depends on nothing but the subtree (no support state)
+function t2t_rewrite (result, memo, cache) {
+    if (result.failed ()) {
+	let e = Error (result.message);
+	e.parseFailure = true;
+	e.position = result.getRightmostFailurePosition ();
+	throw e;
+    }
+    let stats = { rewritten: 0, reused: 0 };
+    let actions = _rewrite;
+    if (memo && memo.length > 0) {
+	actions = {};
+	for (let [rule, action] of Object.entries (_rewrite)) {
+	    if (memo.some (m => rule == m || rule.startsWith (m + '_'))) {
+		let cached = function (...children) {
+		    let out = cache.get (this._node);
+		    if (out === undefined) {
+			out = action.apply (this, children);
+			cache.set (this._node, out);
+			stats.rewritten += 1;
+		    } else {
+			stats.reused += 1;
+		    }
+		    return out;
+		};
+		// ohm checks the arity of every action
+		Object.defineProperty (cached, 'length', { value: action.length });
+		actions[rule] = cached;
+	    } else {
+		actions[rule] = action;
+	    }
+	}
+    }
+    let sem = t2t_parser ().createSemantics ();
+    sem.addOperation ('rwr', actions);
+    xbreak ();
+    let s = sem (result).rwr ();
+    while (! is_terminated ()) {
+	xbreak ();
+	s = expand (s, t2t_parser ());
+    }
+    stats.out = s;
+    return stats;
+}
+
+// exported under short names, the t2t_ prefix keeps the local names clear of
+// functions defined in support.mjs
+export { t2t_parser as parser, t2t_name as name, t2t_reset as reset, t2t_transform as transform, t2t_rewrite as rewrite };
+
+function isMain () {
+    if (! process.argv[1]) {
+	return false;
+    }
+    return fs.realpathSync (process.argv[1]) == fs.realpathSync (fileURLToPath (import.meta.url));
+}
+
+if (isMain ()) {
     try {
-	let parser = ohm.grammar (grammar);
-	let s = src;
-	xcontinue ();
-	while (! is_terminated ()) {
-	    xbreak ();
-	    s = expand (s, parser);
+	const argv = process.argv.slice(2);
+	let srcFilename = argv[0];
+	if ('-' == srcFilename) { srcFilename = 0 }
+	let src = fs.readFileSync(srcFilename, 'utf-8');
+	try {
+	    console.log (t2t_transform (src));
+	    process.exit (0);
+	} catch (e) {
+	    //console.error (`${e}\nargv=${argv}\ngrammar=${grammarname (grammar)}\src=\n${src}`);
+	    console.error (`${e}\n\ngrammar = "${grammarname (grammar)}\n"`);
+	    process.exit (1);
 	}
-	console.log (s);
-	process.exit (0);
     } catch (e) {
-	//console.error (`${e}\nargv=${argv}\ngrammar=${grammarname (grammar)}\src=\n${src}`);
-	console.error (`${e}\n\ngrammar = "${grammarname (grammar)}\n"`);
+	console.error (`${e}\n\ngrammar = "${grammarname (grammar)}"\n`);
 	process.exit (1);
     }
-} catch (e) {
-    console.error (`${e}\n\ngrammar = "${grammarname (grammar)}"\n`);
-    process.exit (1);
 }
-
@@ -0,0 +1,159 @@
+// t2t worker - serves transform requests for any number of assembled
+// transpilers (see t2tcache.py) from one long-lived node process, so that
+// node startup and ohm.grammar () are paid once per grammar instead of once
+// per stage per file
+//
+//   node worker.mjs --stdio           requests on stdin, replies on stdout
+//   node worker.mjs --socket <path>   listen on a Unix socket
+//
+// framing: one JSON object per line, in both directions
+//   {"id": 1, "transpiler": "/abs/path/<key>.nanodsl.mjs", "src": "...", "reset": true}
+//   {"id": 1, "ok": true, "out": "..."}
+//   {"id": 1, "ok": false, "error": "...", "parse": false, "position": 120}
+// "reset" (default true) restarts support.mjs state such as the line counter,
+// pass false to continue where the previous request for that transpiler left off
+// "parse" is true when the input did not match the grammar, as opposed to an
+// error raised while rewriting; "position" is then where matching failed
+// (UTF-16 code units into src)
+// {"op": "ping"} answers {"ok": true} without touching any transpiler
+// {"op": "stats"} answers with the worker's memory use in KB,
+//   {"ok": true, "rss": ..., "maxrss": ...}
+//
+// sessions keep an ohm matcher per input, so that an edit only re-matches
+// what it touched (grammar.matcher () and replaceInputRange)
+//   {"op": "open", "session": "s", "transpiler": "...", "memo": ["TopLevelStatement"]}
+//   {"op": "edit", "session": "s", "start": 10, "end": 12, "text": "..."}
+//     -> {"ok": true, "out": "...", "rewritten": 1, "reused": 40}
+//   {"op": "close", "session": "s"}
+// start and end count UTF-16 code units, as JavaScript strings do; every
+// edit answers with the rewrite of the whole current input
+
+import * as fs from 'fs';
+import * as net from 'net';
+import * as readline from 'readline';
+import { pathToFileURL } from 'url';
+
+let transpilers = new Map ();
+
+async function load (path) {
+    let t = transpilers.get (path);
+    if (t == undefined) {
+	// the path contains the content hash, so a loaded module never goes stale
+	t = await import (pathToFileURL (path).href);
+	t.parser ();
+	transpilers.set (path, t);
+    }
+    return t;
+}
+
+let sessions = new Map ();
+
+function session (name) {
+    let s = sessions.get (name);
+    if (s == undefined) {
+	throw Error (`no session ${name}`);
+    }
+    return s;
+}
+
+async function serve (request) {
+    let reply = { id: request.id };
+    try {
+	let op = request.op || 'transform';
+	if (op == 'ping') {
+	    reply.ok = true;
+	} else if (op == 'stats') {
+	    reply.rss = Math.round (process.memoryUsage ().rss / 1024);
+	    reply.maxrss = process.resourceUsage ().maxRSS;
+	    reply.ok = true;
+	} else if (op == 'transform') {
+	    let t = await load (request.transpiler);
+	    if (request.reset !== false) {
+		t.reset ();
+	    }
+	    try {
+		reply.out = t.transform (request.src);
+		reply.ok = true;
+	    } catch (e) {
+		reply.ok = false;
+		reply.error = `${e}\n\ngrammar = "${t.name ()}"\n`;
+		reply.parse = e.parseFailure === true;
+		reply.position = e.position;
+	    }
+	} else if (op == 'open') {
+	    let t = await load (request.transpiler);
+	    let matcher = t.parser ().matcher ();
+	    matcher.setInput ('');
+	    sessions.set (request.session, { t: t, matcher: matcher, memo: request.memo || [], cache: new WeakMap () });
+	    reply.ok = true;
+	} else if (op == 'edit') {
+	    let s = session (request.session);
+	    s.matcher.replaceInputRange (request.start, request.end, request.text);
+	    s.t.reset ();
+	    try {
+		Object.assign (reply, s.t.rewrite (s.matcher.match (), s.memo, s.cache));
+		reply.ok = true;
+	    } catch (e) {
+		reply.ok = false;
+		reply.error = `${e}\n\ngrammar = "${s.t.name ()}"\n`;
+		reply.parse = e.parseFailure === true;
+		reply.position = e.position;
+	    }
+	} else if (op == 'close') {
+	    sessions.delete (request.session);
+	    reply.ok = true;
+	} else {
+	    throw Error (`unknown op ${op}`);
+	}
+    } catch (e) {
+	reply.ok = false;
+	reply.error = `${e}`;
+    }
+    return JSON.stringify (reply) + '\n';
+}
+
+// requests on one connection are answered strictly in order
+function attach (input, output) {
+    let pending = Promise.resolve ();
+    let lines = readline.createInterface ({ input: input, crlfDelay: Infinity });
+    lines.on ('line', (line) => {
+	if (line.trim () == '') {
+	    return;
+	}
+	pending = pending.then (async () => {
+	    let request;
+	    try {
+		request = JSON.parse (line);
+	    } catch (e) {
+		output.write (JSON.stringify ({ ok: false, error: `bad request: ${e}` }) + '\n');
+		return;
+	    }
+	    output.write (await serve (request));
+	});
+    });
+    return lines;
+}
+
+const argv = process.argv.slice (2);
+if (argv[0] == '--stdio') {
+    attach (process.stdin, process.stdout);
+} else if (argv[0] == '--socket' && argv[1]) {
+    let path = argv[1];
+    fs.rmSync (path, { force: true });
+    let server = net.createServer ((conn) => {
+	conn.setEncoding ('utf-8');
+	attach (conn, conn);
+	conn.on ('error', () => conn.destroy ());
+    });
+    let shutdown = () => {
+	server.close ();
+	fs.rmSync (path, { force: true });
+	process.exit (0);
+    };
+    process.on ('SIGINT', shutdown);
+    process.on ('SIGTERM', shutdown);
+    server.listen (path);
+} else {
+    console.error ('usage: node worker.mjs --stdio | --socket <path>');
+    process.exit (1);
+}
@@ -0,0 +1,288 @@
+"""t2tworker - Python side of the t2t worker (t2td/lib/worker.mjs)
+
+A worker keeps every transpiler it has been asked about loaded, with its
+grammar compiled.  It is reached either through a daemon listening on a Unix
+socket (started with t2t-daemon) or as a private child process talking over
+stdin/stdout.  Both speak one JSON object per line.
+
+Stream feeds a transpiler a large input piece by piece, Session keeps one
+input matched and re-matches only what an edit touched, see their docstrings.
+"""
+
+import json
+import os
+import socket
+import subprocess
+from pathlib import Path
+
+import t2tcache
+
+SOCKET_NAME = "t2td.sock"
+
+
+class WorkerError(Exception):
+    """The transpiler rejected its input; the message is what t2t would print"""
+
+    def __init__(self, message, parse=False, position=None):
+        super().__init__(message)
+        self.parse = parse
+        self.position = position
+
+
+def worker_script(pbp):
+    return Path(pbp) / "t2td" / "lib" / "worker.mjs"
+
+
+def socket_path(pbpwd):
+    """Where the daemon for a project listens, T2TD_SOCKET overrides"""
+    override = os.environ.get("T2TD_SOCKET")
+    if override:
+        return Path(override)
+    return Path(pbpwd) / t2tcache.CACHE_DIRNAME / SOCKET_NAME
+
+
+class Connection:
+    """Line-framed JSON requests over a pair of text streams"""
+
+    def __init__(self, rfile, wfile):
+        self.rfile = rfile
+        self.wfile = wfile
+        self.next_id = 0
+
+    def request(self, **fields):
+        self.next_id += 1
+        fields["id"] = self.next_id
+        self.wfile.write(json.dumps(fields) + "\n")
+        self.wfile.flush()
+        line = self.rfile.readline()
+        if not line:
+            raise ConnectionError("t2t worker closed the connection")
+        reply = json.loads(line)
+        if not reply.get("ok"):
+            raise WorkerError(reply.get("error", "t2t worker failed"), reply.get("parse", False),
+                              reply.get("position"))
+        return reply
+
+    def transform(self, transpiler, src, reset=True):
+        """Run one assembled transpiler over src and return its output"""
+        reply = self.request(transpiler=str(Path(transpiler).resolve()), src=src, reset=reset)
+        return reply["out"]
+
+    def close(self):
+        for f in (self.wfile, self.rfile):
+            try:
+                f.close()
+            except OSError:
+                pass
+
+
+class Daemon(Connection):
+    """Client of a shared worker listening on a Unix socket"""
+
+    def __init__(self, path):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(str(path))
+        super().__init__(self.sock.makefile("r", encoding="utf-8"),
+                         self.sock.makefile("w", encoding="utf-8"))
+
+    def close(self):
+        super().close()
+        self.sock.close()
+
+
+class Worker(Connection):
+    """A private worker running as a child process for the lifetime of this object"""
+
+    def __init__(self, pbpwd, pbp):
+        self.process = subprocess.Popen(
+            ["node", str(worker_script(pbp)), "--stdio"],
+            cwd=str(pbpwd),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            encoding="utf-8"
+        )
+        super().__init__(self.process.stdout, self.process.stdin)
+
+    def close(self):
+        super().close()
+        self.process.wait()
+
+
+CHUNK = 1 << 18
+RETRIES = 8
+
+
+def source_boundary():
+    """Cut raw .grid source at newlines that are not inside a string
+
+    Only strings span lines ("" inside a string toggles twice and so
+    changes nothing); a ' outside a string starts a comment that runs to
+    the end of the line."""
+    in_string = False
+
+    def cut_after(line):
+        nonlocal in_string
+        for c in line:
+            if in_string:
+                if c == '"':
+                    in_string = False
+            elif c == '"':
+                in_string = True
+            elif c == "'":
+                break
+        return not in_string
+    return cut_after
+
+
+def eol_boundary():
+    """Cut prepassed text after a line that ends in a ⎩N⎭ (EOL/nl) marker"""
+    def cut_after(line):
+        return line.rstrip("\r\n").endswith("⎭")
+    return cut_after
+
+
+class Stream:
+    """Run one transpiler over input that arrives in pieces, with bounded memory
+
+    Complete lines are buffered until at least `chunk` characters end at a
+    safe boundary, then the buffer is transformed and its output returned at
+    once.  The transpiler keeps its support.mjs state between chunks (line
+    numbers continue), so the concatenated outputs equal the output for the
+    whole input, provided every chunk is a sequence of complete top-level
+    statements.  A boundary is only a hint: if the buffer does not parse on
+    its own (say a cut inside Define ... End), more input is buffered and the
+    next attempt waits for twice as much.  Such a failure is at the end of the
+    buffer; one before the end of the previous failed buffer is in text that
+    more input did not complete, a real syntax error, and is raised at once,
+    as is the failure after RETRIES attempts when the worker gives no
+    position."""
+
+    def __init__(self, connection, transpiler, boundary=None, chunk=CHUNK):
+        self.connection = connection
+        self.transpiler = transpiler
+        self.boundary = boundary
+        self.chunk = chunk
+        self.wanted = chunk
+        self.partial = ""
+        self.lines = []
+        self.size = 0
+        self.first = True
+        self.failed = 0
+        self.retries = 0
+
+    def feed(self, text):
+        """Add text, return whatever output is ready"""
+        out = []
+        pieces = (self.partial + text).split("\n")
+        self.partial = pieces.pop()
+        for piece in pieces:
+            line = piece + "\n"
+            if self.boundary is None:
+                # pick the cut rule from the first line
+                self.boundary = eol_boundary() if "⎩" in line else source_boundary()
+            self.lines.append(line)
+            self.size += len(line)
+            if self.boundary(line) and self.size >= self.wanted:
+                out.append(self.flush(final=False))
+        return "".join(out)
+
+    def flush(self, final):
+        src = "".join(self.lines) + (self.partial if final else "")
+        if final:
+            self.partial = ""
+        if src == "" and not self.first:
+            return ""
+        try:
+            out = self.connection.transform(self.transpiler, src, reset=self.first)
+        except WorkerError as e:
+            if final or not e.parse:
+                raise
+            if e.position is None:
+                self.retries += 1
+                if self.retries > RETRIES:
+                    raise
+            elif e.position < self.failed:
+                raise
+            self.failed = utf16_length(src)
+            self.wanted *= 2
+            return ""
+        self.first = False
+        self.failed = 0
+        self.retries = 0
+        self.lines = []
+        self.size = 0
+        self.wanted = self.chunk
+        return out
+
+    def close(self):
+        """Transform what is left, end with the newline console.log () would print"""
+        return self.flush(final=True) + "\n"
+
+
+def edit_range(old, new):
+    """Return (start, end, text) such that old[:start] + text + old[end:] == new"""
+    n = min(len(old), len(new))
+    start = 0
+    while start < n and old[start] == new[start]:
+        start += 1
+    end_old, end_new = len(old), len(new)
+    while end_old > start and end_new > start and old[end_old - 1] == new[end_new - 1]:
+        end_old -= 1
+        end_new -= 1
+    return start, end_old, new[start:end_new]
+
+
+def utf16_length(s):
+    return len(s.encode("utf-16-le")) // 2
+
+
+class Session:
+    """One transpiler kept matched against an input that changes over time
+
+    The worker holds an ohm matcher for the input; update () sends it only
+    the edited range (common prefix and suffix stripped), so ohm re-matches
+    just the region the edit invalidated.  Rules named in memo are rewritten
+    only for subtrees that changed, see t2t_rewrite () in tail.part.js."""
+
+    def __init__(self, connection, name, transpiler, memo=()):
+        self.connection = connection
+        self.name = name
+        self.text = ""
+        self.output = None
+        self.rewritten = 0
+        self.reused = 0
+        connection.request(op="open", session=name, transpiler=str(Path(transpiler).resolve()), memo=list(memo))
+
+    def update(self, text):
+        """Make text the session's input, return the rewrite of all of it"""
+        if text == self.text and self.output is not None:
+            self.rewritten = 0
+            return self.output
+        start, end, replacement = edit_range(self.text, text)
+        prefix = utf16_length(self.text[:start])
+        old = self.text
+        # the matcher takes the edit even when the new text fails to match
+        self.text = text
+        reply = self.connection.request(op="edit", session=self.name,
+                                        start=prefix, end=prefix + utf16_length(old[start:end]),
+                                        text=replacement)
+        self.output = reply["out"]
+        self.rewritten = reply.get("rewritten", 0)
+        self.reused = reply.get("reused", 0)
+        return self.output
+
+    def close(self):
+        self.connection.request(op="close", session=self.name)
+
+
+def connect(pbpwd):
+    """Return a client for the project's daemon, or None if no daemon is running"""
+    path = socket_path(pbpwd)
+    if not path.exists():
+        return None
+    try:
+        return Daemon(path)
+    except OSError:
+        # stale socket left behind by a daemon that was killed
+        return None
@@ -4,15 +4,17 @@ import os
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 from repl import live_update
 
-# Read from stdin and replace ¶ with newline
-src = sys.stdin.read().replace('¶', '\n')
+# Replace ¶ with newline, a line at a time so that input of any size
+# passes through in constant memory
 
 # Send live update first
 # live_update("Info", f"cleanup.py")
 
-# Write to /tmp/src
+# Write to /tmp/src and to stdout
 with open('/tmp/src', 'w') as f:
-    f.write(src)
-
-# Print to stdout
-print(src)
+    for line in sys.stdin:
+        src = line.replace('¶', '\n')
+        f.write(src)
+        sys.stdout.write(src)
+# print (src) used to end the output with one more newline
+sys.stdout.write('\n')
@@ -1,15 +1,1436 @@
+import math as _math
+import operator as _operator
+from bisect import bisect_left as _bisect_left, bisect_right as _bisect_right
+from collections import deque as _deque
+
+_unset = object ()
+
+# cells are keyed by one int, column << 32 | row (A1 is 1 << 32 | 1);
+# gridc.py packs literal addresses at compile time, names like "A1" only
+# appear when the cells are exported
+_ROWBITS = 32
+_ROWMASK = (1 << _ROWBITS) - 1
+
+# a chunk is 1024 consecutive rows of one column, held in a dict while it
+# has few cells and in a list once it has more than _DENSE, so that dense
+# regions are contiguous and scattered cells cost no more than a dict entry
+_CHUNKBITS = 10
+_CHUNK = 1 << _CHUNKBITS
+_CHUNKMASK = _CHUNK - 1
+_DENSE = 64
+_TOPSIZE = 1 << (_ROWBITS - _CHUNKBITS)
+
+# running totals (sum and count of the numbers) of one column, so that
+# sum [A1:A100000] costs O(log n) instead of a scan: a Fenwick tree over the
+# rows of each chunk and a sparse one over the chunk totals, both updated
+# by every write to the column.  Only ints go into the trees, whose sums
+# are exact; a float (inf and nan among them) could not be taken out again
+# without leaving its rounding behind, so the column's floats are kept by
+# row and those in a range are added to its int sum with math.fsum
+class ColumnTotals:
+    __slots__ = ("chunks", "top", "floats", "floatrows")
+
+    def __init__ (self):
+        self.chunks = {}     # chunk of the column -> (sums, counts), Fenwick lists
+        self.top = {}        # Fenwick index (chunk + 1) -> (sum, count)
+        self.floats = {}     # row -> float
+        self.floatrows = []  # the rows of floats, ascending
+
+    def add (self, row, dsum, dcount):
+        c = row >> _CHUNKBITS
+        trees = self.chunks.get (c)
+        if trees is None:
+            trees = self.chunks [c] = ([0] * (_CHUNK + 1), [0] * (_CHUNK + 1))
+        sums, counts = trees
+        i = (row & _CHUNKMASK) + 1
+        while i <= _CHUNK:
+            sums [i] += dsum
+            counts [i] += dcount
+            i += i & -i
+        top = self.top
+        i = c + 1
+        while i <= _TOPSIZE:
+            s, n = top.get (i, (0, 0))
+            top [i] = (s + dsum, n + dcount)
+            i += i & -i
+
+    def change (self, row, old, new):
+        dsum = dcount = 0
+        if type (old) is int:
+            dsum -= old
+            dcount -= 1
+        elif type (old) is float:
+            dcount -= 1
+            del self.floats [row]
+            rows = self.floatrows
+            del rows [_bisect_left (rows, row)]
+        if type (new) is int:
+            dsum += new
+            dcount += 1
+        elif type (new) is float:
+            dcount += 1
+            self.floats [row] = new
+            rows = self.floatrows
+            rows.insert (_bisect_left (rows, row), row)
+        if dcount or dsum:
+            self.add (row, dsum, dcount)
+
+    # (int sum, count) of rows 0 to row
+    def prefix (self, row):
+        c = row >> _CHUNKBITS
+        s = n = 0
+        top = self.top
+        i = c
+        while i > 0:
+            ts, tn = top.get (i, (0, 0))
+            s += ts
+            n += tn
+            i -= i & -i
+        trees = self.chunks.get (c)
+        if trees is not None:
+            sums, counts = trees
+            i = (row & _CHUNKMASK) + 1
+            while i > 0:
+                s += sums [i]
+                n += counts [i]
+                i -= i & -i
+        return s, n
+
+    # (sum of the ints, count of the numbers, the floats) of rows first to last
+    def total (self, first, last):
+        s2, n2 = self.prefix (last)
+        s1, n1 = self.prefix (first - 1)
+        rows = self.floatrows
+        floats = self.floats
+        return s2 - s1, n2 - n1, [floats [r] for r in rows [_bisect_left (rows, first):_bisect_right (rows, last)]]
+
+# ints plus floats rounded once, as an int when there are no floats
+def _exactsum (ints, floats):
+    if not floats:
+        return ints
+    try:
+        return _math.fsum (floats + [ints])
+    except (OverflowError, ValueError):
+        # inf - inf, or finite floats whose sum overflows
+        return ints + sum (floats)
+
+class CellStore:
+    def __init__ (self):
+        self.chunks = {}
+        self.count = 0
+        self.columns = {}  # column -> the chunks of it that hold or held cells
+        self.totals = {}   # column -> ColumnTotals, for the columns ranges were aggregated over
+
+    def get (self, key, default = None):
+        chunk = self.chunks.get (key >> _CHUNKBITS)
+        if chunk is None:
+            return default
+        if type (chunk) is list:
+            value = chunk [key & _CHUNKMASK]
+            return default if value is _unset else value
+        return chunk.get (key & _CHUNKMASK, default)
+
+    def __getitem__ (self, key):
+        value = self.get (key, _unset)
+        if value is _unset:
+            raise KeyError (key)
+        return value
+
+    def __contains__ (self, key):
+        return self.get (key, _unset) is not _unset
+
+    def __setitem__ (self, key, value):
+        if self.totals:
+            totals = self.totals.get (key >> _ROWBITS)
+            if totals is not None:
+                totals.change (key & _ROWMASK, self.get (key), value)
+        c = key >> _CHUNKBITS
+        i = key & _CHUNKMASK
+        chunk = self.chunks.get (c)
+        if chunk is None:
+            self.chunks [c] = {i: value}
+            self.columns.setdefault (key >> _ROWBITS, []).append (c)
+            self.count += 1
+        elif type (chunk) is list:
+            if chunk [i] is _unset:
+                self.count += 1
+            chunk [i] = value
+        elif i in chunk:
+            chunk [i] = value
+        elif len (chunk) < _DENSE:
+            chunk [i] = value
+            self.count += 1
+        else:
+            dense = [_unset] * _CHUNK
+            for j, v in chunk.items ():
+                dense [j] = v
+            dense [i] = value
+            self.chunks [c] = dense
+            self.count += 1
+
+    def pop (self, key, default = _unset):
+        chunk = self.chunks.get (key >> _CHUNKBITS)
+        i = key & _CHUNKMASK
+        if chunk is None:
+            value = _unset
+        elif type (chunk) is list:
+            value = chunk [i]
+            chunk [i] = _unset
+        else:
+            value = chunk.pop (i, _unset)
+        if value is _unset:
+            if default is _unset:
+                raise KeyError (key)
+            return default
+        self.count -= 1
+        if self.totals:
+            totals = self.totals.get (key >> _ROWBITS)
+            if totals is not None:
+                totals.change (key & _ROWMASK, value, None)
+        return value
+
+    def __delitem__ (self, key):
+        self.pop (key)
+
+    def __len__ (self):
+        return self.count
+
+    def items (self):
+        for c, chunk in self.chunks.items ():
+            base = c << _CHUNKBITS
+            if type (chunk) is list:
+                for i, value in enumerate (chunk):
+                    if value is not _unset:
+                        yield base | i, value
+            else:
+                for i, value in chunk.items ():
+                    yield base | i, value
+
+    # the totals of a column, built from its cells the first time they are asked for
+    def columntotals (self, column):
+        totals = self.totals.get (column)
+        if totals is None:
+            totals = ColumnTotals ()
+            for c in self.columns.get (column, ()):
+                chunk = self.chunks [c]
+                base = (c << _CHUNKBITS) & _ROWMASK
+                pairs = enumerate (chunk) if type (chunk) is list else chunk.items ()
+                for i, value in pairs:
+                    if _isnumber (value):
+                        totals.change (base | i, None, value)
+            self.totals [column] = totals
+        return totals
+
+    # (sum of the ints, count of the numbers, the floats) in the rectangle
+    # from key first to key last
+    def parts (self, first, last):
+        s = n = 0
+        floats = []
+        for column in range (first >> _ROWBITS, (last >> _ROWBITS) + 1):
+            ts, tn, tf = self.columntotals (column).total (first & _ROWMASK, last & _ROWMASK)
+            s += ts
+            n += tn
+            floats += tf
+        return s, n, floats
+
+    # (sum, count) of the numbers in the rectangle from key first to key last
+    def total (self, first, last):
+        s, n, floats = self.parts (first, last)
+        return _exactsum (s, floats), n
+
+# "A1" for the key of A1
+def cellname (key):
+    return column_name (key >> _ROWBITS).upper () + str (key & _ROWMASK)
+
+# which cells spills and explicit assignments occupy, per column: the
+# extent of each spill as a span of rows (spans never overlap, a spill that
+# would is refused) and every explicitly assigned cell as a row, both kept
+# sorted, so whether a rectangle is free costs O(columns * log n)
+class Occupancy:
+    def __init__ (self):
+        self.starts = {}   # column -> first rows of its spans, ascending
+        self.spans = {}    # column -> [(first row, last row, anchor key)], same order
+        self.rows = {}     # column -> explicitly assigned rows, ascending
+        self.counts = {}   # key -> how many nodes assign it
+
+    def assign (self, key):
+        n = self.counts.get (key, 0)
+        self.counts [key] = n + 1
+        if n == 0:
+            rows = self.rows.setdefault (key >> _ROWBITS, [])
+            rows.insert (_bisect_left (rows, key & _ROWMASK), key & _ROWMASK)
+
+    def unassign (self, key):
+        n = self.counts.pop (key)
+        if n > 1:
+            self.counts [key] = n - 1
+        else:
+            rows = self.rows [key >> _ROWBITS]
+            del rows [_bisect_left (rows, key & _ROWMASK)]
+
+    def spill (self, first, last):
+        r1, r2 = first & _ROWMASK, last & _ROWMASK
+        for column in range (first >> _ROWBITS, (last >> _ROWBITS) + 1):
+            starts = self.starts.setdefault (column, [])
+            i = _bisect_left (starts, r1)
+            starts.insert (i, r1)
+            self.spans.setdefault (column, []).insert (i, (r1, r2, first))
+
+    def unspill (self, first, last):
+        r1 = first & _ROWMASK
+        for column in range (first >> _ROWBITS, (last >> _ROWBITS) + 1):
+            i = _bisect_left (self.starts [column], r1)
+            del self.starts [column] [i]
+            del self.spans [column] [i]
+
+    # the key of the anchor of a spill over the rectangle, or, with cells,
+    # of an assigned cell in it; None when it is free
+    def collision (self, first, last, cells = True):
+        r1, r2 = first & _ROWMASK, last & _ROWMASK
+        for column in range (first >> _ROWBITS, (last >> _ROWBITS) + 1):
+            starts = self.starts.get (column)
+            if starts:
+                # the last span starting at or before r2 is the only one that can reach r1
+                i = _bisect_right (starts, r2) - 1
+                if i >= 0 and self.spans [column] [i] [1] >= r1:
+                    return self.spans [column] [i] [2]
+            rows = self.rows.get (column) if cells else None
+            if rows:
+                i = _bisect_left (rows, r1)
+                if i < len (rows) and rows [i] <= r2:
+                    return column << _ROWBITS | rows [i]
+        return None
+
+# the nodes whose last evaluation read a range, by the rows of each column
+# it covers: the spans of a column are kept in lists sorted by first row,
+# one list per length class (a span of class j is shorter than 2 ** j
+# rows), so only the spans of a class that start less than 2 ** j rows
+# above a row can hold it, and finding the readers of a cell costs
+# O(classes * log n) plus the spans it is checked against
+class Watchers:
+    def __init__ (self):
+        self.spans = {}      # column -> {class: [(first row, last row, node)], ascending}
+        self.watching = {}   # node -> [(column, first row, last row)]
+
+    def watch (self, n, first, last):
+        r1, r2 = first & _ROWMASK, last & _ROWMASK
+        j = (r2 - r1).bit_length ()
+        watching = self.watching.setdefault (n, [])
+        for column in range (first >> _ROWBITS, (last >> _ROWBITS) + 1):
+            spans = self.spans.setdefault (column, {}).setdefault (j, [])
+            span = (r1, r2, n)
+            spans.insert (_bisect_left (spans, span), span)
+            watching.append ((column, r1, r2))
+
+    def forget (self, n):
+        for column, r1, r2 in self.watching.pop (n, ()):
+            classes = self.spans [column]
+            j = (r2 - r1).bit_length ()
+            spans = classes [j]
+            del spans [_bisect_left (spans, (r1, r2, n))]
+            if not spans:
+                del classes [j]
+                if not classes:
+                    del self.spans [column]
+
+    def readers (self, key):
+        classes = self.spans.get (key >> _ROWBITS)
+        if not classes:
+            return ()
+        row = key & _ROWMASK
+        found = set ()
+        for j, spans in classes.items ():
+            i = _bisect_left (spans, (row - (1 << j) + 1,))
+            end = _bisect_left (spans, (row + 1,))
+            for r1, r2, m in spans [i:end]:
+                if r2 >= row:
+                    found.add (m)
+        return found
+
+# a program's variables live in subject.slots, a flat list indexed by the slot
+# numbers gridc.py assigned at compile time; names is the matching debug table
+#
+# the subject is also the sheet's dependency graph: every top-level
+# definition, cell assignment and Return is a node, registered in program
+# order with the slots its formula reads, and recalc () evaluates the nodes
+# not evaluated yet in topological order.  A node depends on
+#   the latest definition of each slot it reads, or, for a forward reference,
+#     the first one registered later (waiting)
+#   the previous definition of its own target, and every node that read it
+#   the previous Return, so output keeps its order
+# targets are slot numbers, ~key for cells (negative, so never a slot), or
+# None for a Return; a read of a cell is listed as ~key too
+#
+# after the first evaluation, change () gives a slot a new value and
+# recalc () recomputes only what depends on it: the nodes reachable from
+# the changed ones are marked dirty and visited in topological order, and
+# a dirty node is recomputed only if a node before it produced a different
+# value, so a recomputation that changes nothing stops there
+#
+# cells are also found at run time: read () records which cells each
+# evaluation actually read (its read-set, replaced on every evaluation), and
+# a cell that changes makes its readers stale.  A reader already evaluated
+# in the current pass is evaluated again in another pass, so [A{n}] follows
+# both n and whichever cell n points at.  An interpolated assignment
+# (cellat ()) computes its address on every evaluation as well.  A range
+# read ([A1:B1000]) is recorded as row spans per column (watchers), not
+# cell by cell, so registering it costs one entry per column
+class Subject:
+    def __init__ (self):
+        self.slots = []
+        self.names = []
+        self.cells = CellStore ()
+        self.index = {}
+        self.inputs = 0   # how many of arguments the Inputs took
+        self.graph ()
+
+    # a new frame numbers its slots from 0 again, so it starts a new graph
+    def graph (self):
+        self.formulas = []
+        self.targets = []
+        self.values = []
+        self.successors = {}
+        self.latest = {}
+        self.readers = {}
+        self.waiting = {}
+        self.lastEffect = None
+        self.pending = []
+        self.recomputed = 0
+        self.addresses = {}
+        self.placed = {}
+        self.owners = {}
+        self.readsets = {}
+        self.observers = {}
+        self.evaluating = None
+        self.touched = []
+        self.watchers = Watchers ()
+        self.blocks = {}     # node -> (first key, last key) of a block assignment
+        self.anchors = {}    # node -> anchor key of a spill
+        self.spilled = {}    # node -> (first key, last key) its spill covers now
+        self.occupancy = Occupancy ()
+        self.types = {}      # slot -> the type it was declared with
+
 def fresh ():
-    pass # I don't know the semantics yet
+    return Subject ()
 
-def input (subject, name, type_name):
-    pass # I don't know the semantics yet
+def formula (subject, target, reads, compute):
+    n = len (subject.formulas)
+    subject.formulas.append (compute)
+    subject.targets.append (target)
+    subject.values.append (_unset)
+    successors = subject.successors
+    latest = subject.latest
+    readers = subject.readers
+    for slot in reads:
+        before = latest.get (slot)
+        if before is None:
+            subject.waiting.setdefault (slot, []).append (n)
+            continue
+        after = successors.get (before)
+        if after is None:
+            successors [before] = [n]
+        else:
+            after.append (n)
+        r = readers.get (slot)
+        if r is None:
+            readers [slot] = [n]
+        else:
+            r.append (n)
+    if target is _somewhere or target is _block or target is _spill:
+        pass
+    elif target is None:
+        if subject.lastEffect is not None:
+            successors.setdefault (subject.lastEffect, []).append (n)
+        subject.lastEffect = n
+    else:
+        before = latest.get (target)
+        if before is not None:
+            successors.setdefault (before, []).append (n)
+            for reader in readers.pop (target, ()):
+                if reader != n:
+                    successors.setdefault (reader, []).append (n)
+        latest [target] = n
+        if subject.waiting:
+            waiting = [reader for reader in subject.waiting.pop (target, ()) if reader != n]
+            if waiting:
+                successors.setdefault (n, []).extend (waiting)
+                readers [target] = waiting
+                # those already evaluated (in an earlier stream chunk) read nothing
+                subject.pending.extend (waiting)
+    subject.pending.append (n)
+    return n
 
-def output (subject, name, type_name):
-    pass # I don't know the semantics yet
+def cell (subject, key, reads, compute):
+    _claim (subject, key)
+    formula (subject, ~key, reads, compute)
 
-def push (subject, name, type_name):
-    pass # I don't know the semantics yet
+# an explicit assignment of a cell; a spill already over it is an error
+def _claim (subject, key):
+    anchor = subject.occupancy.collision (key, key, cells = False)
+    if anchor is not None:
+        raise ValueError (f"{cellname (key)} is in the spill from {cellname (anchor)}")
+    subject.occupancy.assign (key)
+
+def effect (subject, reads, compute):
+    formula (subject, None, reads, compute)
+
+_somewhere = object ()
+
+def cellat (subject, reads, address, compute):
+    subject.addresses [formula (subject, _somewhere, reads, compute)] = address
+
+_block = object ()
+
+# [A1:C2] := value, the whole rectangle written by one node
+def cellblock (subject, reads, first, last, compute):
+    for key in Range (subject, first, last).keys ():
+        _claim (subject, key)
+    subject.blocks [formula (subject, _block, reads, compute)] = (first, last)
+
+_spill = object ()
+
+# [^B2] := value, an Array or Range written out from B2 rightwards and
+# down, as far as its shape reaches; the extent follows the value
+def spill (subject, reads, anchor, compute):
+    subject.anchors [formula (subject, _spill, reads, compute)] = anchor
+
+# the far corner of value spilled from anchor
+def _extent (anchor, value):
+    if isinstance (value, (Array, Range)):
+        if len (value.shape) != 2:
+            raise ValueError (f"cannot spill an array of {len (value.shape)} dimensions")
+        rows, columns = value.shape
+    else:
+        rows = columns = 1
+    return address ((anchor >> _ROWBITS) + columns - 1, (anchor & _ROWMASK) + rows - 1)
+
+# re-spill node n: claim the new extent if it changed (refusing one that
+# runs into another spill or an assigned cell), empty the cells it no
+# longer covers, and write the value.  Returns whether a cell changed
+def _respill (subject, n, value):
+    anchor = subject.anchors [n]
+    extent = (anchor, _extent (anchor, value))
+    before = subject.spilled.get (n)
+    changed = False
+    if extent != before:
+        occupancy = subject.occupancy
+        if before is not None:
+            occupancy.unspill (*before)
+        clash = occupancy.collision (*extent)
+        if clash is not None:
+            if before is not None:
+                occupancy.spill (*before)
+            what = cellname (clash) if clash in occupancy.counts else f"the spill from {cellname (clash)}"
+            raise ValueError (f"the spill from {cellname (anchor)} to {cellname (extent [1])} runs into {what}")
+        occupancy.spill (*extent)
+        subject.spilled [n] = extent
+        if before is not None:
+            covered = Range (subject, *extent)
+            for key in Range (subject, *before).keys ():
+                if not covered.covers (key) and subject.owners.get (key) == n:
+                    del subject.cells [key]
+                    del subject.owners [key]
+                    subject.touched.append (key)
+                    changed = True
+    return _fill (subject, n, *extent, value) or changed
+
+# the key of an interpolated address ([A{n}], [{i :A}5]), column and row
+# numbers counting from 1
+def address (column, row):
+    c = int (column)
+    r = int (row)
+    if c != column or not 0 < c <= 0xffff:
+        raise ValueError (f"column {column!r} is not a column number")
+    if r != row or not 0 < r <= _ROWMASK:
+        raise ValueError (f"row {row!r} is not a row number")
+    return c << _ROWBITS | r
+
+def read (subject, key):
+    n = subject.evaluating
+    if n is not None:
+        readset = subject.readsets.get (n)
+        if readset is None:
+            subject.readsets [n] = {key}
+        else:
+            readset.add (key)
+        subject.observers.setdefault (key, set ()).add (n)
+    return subject.cells.get (key)
+
+# the nodes whose last evaluation read the cell key
+def _readers (subject, key):
+    observers = subject.observers.get (key, ())
+    watchers = subject.watchers.readers (key)
+    if not watchers:
+        return observers
+    return watchers.union (observers)
+
+def _place (subject, n, key, value):
+    current = subject.cells.get (key, _unset)
+    subject.cells [key] = value
+    subject.owners [key] = n
+    if not _same (value, current):
+        subject.touched.append (key)
+    return current
+
+# write value over the rectangle first:last: a Range is copied cell by
+# cell, straight from its source cells unless they overlap the rectangle,
+# an Array element by element, anything else into every cell.  An empty
+# source cell empties its destination.  Returns whether a cell changed
+def _fill (subject, n, first, last, value):
+    block = Range (subject, first, last)
+    keys = block.keys ()
+    cells = subject.cells
+    if isinstance (value, (Range, Array)):
+        if value.shape != block.shape:
+            raise ValueError (f"a {value.shape [0]}x{value.shape [1]} value does not fit "
+                              f"{cellname (block.first)}:{cellname (block.last)}")
+        if isinstance (value, Array):
+            values = value.flat ()
+        elif value.overlaps (block):
+            values = value.values ()
+        else:
+            values = map (cells.get, value.keys ())
+    else:
+        values = [value] * len (keys)
+    changed = False
+    for key, v in zip (keys, values):
+        if v is None:
+            if key in cells:
+                del cells [key]
+                subject.owners.pop (key, None)
+                subject.touched.append (key)
+                changed = True
+        elif not _same (v, _place (subject, n, key, v)):
+            changed = True
+    return changed
+
+def _isslot (target):
+    return type (target) is int and target >= 0
+
+def _same (a, b):
+    try:
+        return a is b or (type (a) is type (b) and bool (a == b))
+    except (TypeError, ValueError):
+        return False
+
+# evaluate node n, return whether anything after it can see a difference:
+# its value changed, or its target held another value (a later definition's)
+def _store (subject, n):
+    readset = subject.readsets.pop (n, None)
+    if readset is not None:
+        for key in readset:
+            subject.observers [key].discard (n)
+    subject.watchers.forget (n)
+    subject.evaluating = n
+    try:
+        value = subject.formulas [n] ()
+    finally:
+        subject.evaluating = None
+    target = subject.targets [n]
+    if target is None:
+        return False
+    old = subject.values [n]
+    subject.values [n] = value
+    if _isslot (target):
+        current = subject.slots [target]
+        subject.slots [target] = value
+        return not (_same (value, old) and _same (value, current))
+    if target is _block:
+        return _fill (subject, n, *subject.blocks [n], value)
+    if target is _spill:
+        return _respill (subject, n, value)
+    if target is _somewhere:
+        target = subject.addresses [n] ()
+        before = subject.placed.get (n)
+        if before != target:
+            _claim (subject, target)
+            if before is not None:
+                subject.occupancy.unassign (before)
+        # moved: the old cell is left empty, unless another node wrote it since
+        if before is not None and before != target and subject.owners.get (before) == n:
+            del subject.cells [before]
+            del subject.owners [before]
+            subject.touched.append (before)
+        subject.placed [n] = target
+    else:
+        target = ~target
+    current = _place (subject, n, target, value)
+    return not (_same (value, old) and _same (value, current))
+
+# evaluate the nodes registered or changed since the last recalc () and
+# whatever depends on them, each after the nodes it depends on (Kahn's
+# algorithm over the dirty nodes only); returns how many were recomputed
+def recalc (subject):
+    recomputed = 0
+    passes = 0
+    while subject.pending:
+        passes += 1
+        if passes > len (subject.formulas) + 1:
+            raise RuntimeError ("cells read each other in a circle")
+        recomputed += _recalc (subject)
+    subject.recomputed = recomputed
+    return recomputed
+
+def _recalc (subject):
+    roots = subject.pending
+    subject.pending = []
+    successors = subject.successors
+    dirty = set (roots)
+    work = list (dirty)
+    while work:
+        for m in successors.get (work.pop (), ()):
+            if m not in dirty:
+                dirty.add (m)
+                work.append (m)
+    indegree = dict.fromkeys (dirty, 0)
+    for n in dirty:
+        for m in successors.get (n, ()):
+            indegree [m] += 1
+    stale = set (roots)
+    ready = _deque (sorted (n for n in dirty if indegree [n] == 0))
+    visited = 0
+    recomputed = 0
+    touched = subject.touched
+    while ready:
+        n = ready.popleft ()
+        indegree [n] = -1
+        visited += 1
+        if n in stale:
+            recomputed += 1
+            if _store (subject, n):
+                stale.update (successors.get (n, ()))
+            # readers of a cell that changed: later in this pass, or again
+            for key in touched:
+                for m in _readers (subject, key):
+                    if indegree.get (m, -1) >= 0:
+                        stale.add (m)
+                    elif m != n:
+                        subject.pending.append (m)
+            touched.clear ()
+        for m in successors.get (n, ()):
+            indegree [m] -= 1
+            if indegree [m] == 0:
+                ready.append (m)
+    if visited != len (dirty):
+        stuck = sorted ({subject.names [subject.targets [n]] for n in dirty
+                         if indegree [n] > 0 and _isslot (subject.targets [n])})
+        raise RuntimeError (f"circular definition of {', '.join (stuck)}")
+    return recomputed
+
+def _slot (subject, name):
+    if isinstance (name, int):
+        return name
+    try:
+        return subject.index [name]
+    except KeyError:
+        raise NameError (f"name '{name}' is not defined") from None
+
+# give a variable (slot number or name) a new value, as if an Input or
+# upstream binding changed, and recompute its dependents; returns how many
+# nodes were recomputed
+def change (subject, name, value):
+    slot = _slot (subject, name)
+    value = check (value, subject.types.get (slot))
+    n = subject.latest.get (slot)
+    if n is None:
+        formula (subject, slot, (), lambda: value)
+    else:
+        subject.formulas [n] = lambda: value
+        subject.pending.append (n)
+    return recalc (subject)
+
+# called once at the top of every emitted program (or stream chunk) with the
+# slot number of its first new name; 0 starts a new frame, anything else
+# extends the frame of the chunks before it
+def frame (subject, first, names):
+    if first == 0:
+        subject.slots = [None] * len (names)
+        subject.names = list (names)
+        subject.index = {}
+        subject.graph ()
+    else:
+        subject.slots.extend ([None] * len (names))
+        subject.names.extend (names)
+    for i in range (first, first + len (names)):
+        subject.index [subject.names [i]] = i
+    return subject.slots
+
+# run-time guard for a value gridc.py could not prove to be of type_name;
+# writes whose type is known at compile time are emitted without one
+_types = {"number": (int, float), "text": (str,)}
 
-def cellAssign (subject, column_name, row_index, type_name):
+def check (value, type_name):
+    types = _types.get (type_name)
+    if types is not None and (isinstance (value, bool) or not isinstance (value, types)):
+        raise TypeError (f"{value!r} is not a {type_name}")
+    return value
+
+# values for the program's top-level Input statements, in order, set by
+# whoever runs it (gridrun.py)
+arguments = []
+
+# a top-level Input: the next of the run's arguments, the value of the
+# slot from then on
+def input (subject, slot, type_name):
+    value = argument (subject, subject.names [slot], type_name)
+    declare (subject, slot, type_name)
+    formula (subject, slot, (), lambda: value)
+
+# the next of arguments, in the order the Inputs run; a number is also
+# accepted as text, the way it comes from the command line
+def argument (subject, name, type_name):
+    n = subject.inputs
+    if n >= len (arguments):
+        raise ValueError (f"no argument given for Input {name}")
+    subject.inputs = n + 1
+    value = arguments [n]
+    if type_name == "number" and isinstance (value, str):
+        try:
+            value = float (value)
+        except ValueError:
+            raise TypeError (f"{value!r} is not a number") from None
+    return check (value, type_name)
+
+def output (subject, slot, type_name):
     pass # I don't know the semantics yet
 
+def push (subject, slot, value):
+    if isinstance (value, Range):
+        value = value.array ()
+    subject.slots [slot] = check (value, subject.types.get (slot))
+
+# a name declared "as T" (For, or a typed definition): writes gridc.py
+# emitted are checked where they are, those that come from outside the
+# compiled code, change () and a push the compiler could not see, here
+def declare (subject, slot, type_name):
+    if type_name is not None:
+        subject.types [slot] = type_name
+
+# the computed cells, keyed the way the test expectations are ("A1"),
+# arrays as nested lists
+def export (subject):
+    return {cellname (key): value.tolist () if isinstance (value, Array) else value
+            for key, value in subject.cells.items ()}
+
+# array values, {1, 2; 3, 4} and the arrays operators make of them
+#
+# an array of numbers is a float64 numpy ndarray, so + - * / \ mod ^ run as
+# one vectorized (broadcasting) operation; arrays holding text, and every
+# array when numpy is not installed, keep their elements in a flat
+# row-major list with a shape and go element by element, broadcasting the
+# same way and giving the same results: a zero divisor or a zero to a
+# negative power gives inf or nan, not an error, an overflow inf, and a
+# fractional power of a negative number nan, not a complex
+try:
+    import numpy as _np
+except ImportError:
+    _np = None
+
+_kernels = {
+    "add": ("add", _operator.add),
+    "sub": ("subtract", _operator.sub),
+    "mul": ("multiply", _operator.mul),
+    "div": ("true_divide", _operator.truediv),
+    "idiv": ("floor_divide", _operator.floordiv),
+    "mod": ("mod", _operator.mod),
+    "pow": ("power", _operator.pow),
+}
+
+def _isnumber (x):
+    return type (x) is int or type (x) is float
+
+# op (x, y) on two elements, giving numpy's float64 result where Python
+# raises or goes complex
+def _ieee (op, x, y):
+    try:
+        r = op (x, y)
+    except ZeroDivisionError:
+        if op is _operator.pow:
+            # 0 to a negative power, -0.0 keeps its sign for odd integer powers
+            return _math.copysign (_inf, x) if y % 2 == 1 else _inf
+        if op is _operator.mod or x == 0 or x != x:
+            return _nan
+        return _math.copysign (_inf, x) * _math.copysign (1, y)
+    except OverflowError:
+        if op is _operator.pow and x < 0 and y % 2 == 1:
+            return -_inf
+        return _inf
+    return _nan if type (r) is complex else r
+
+_inf = float ("inf")
+_nan = float ("nan")
+
+class Array:
+    __slots__ = ("data", "shape")
+
+    def __init__ (self, data, shape):
+        self.data = data      # ndarray, or a flat list of shape's size
+        self.shape = shape
+
+    def tolist (self):
+        if type (self.data) is not list:
+            return self.data.tolist ()
+        def nest (flat, shape):
+            if len (shape) == 1:
+                return list (flat)
+            step = len (flat) // shape [0] if shape [0] else 0
+            return [nest (flat [i * step:(i + 1) * step], shape [1:]) for i in range (shape [0])]
+        return nest (self.data, self.shape)
+
+    def flat (self):
+        return self.data if type (self.data) is list else self.data.ravel ().tolist ()
+
+    def __eq__ (self, other):
+        return isinstance (other, Array) and self.shape == other.shape and self.flat () == other.flat ()
+
+    __hash__ = None
+
+    def __repr__ (self):
+        return f"Array ({self.tolist ()!r})"
+
+def _make (flat, shape):
+    if _np is not None and all (_isnumber (x) for x in flat):
+        return Array (_np.array (flat, dtype = float).reshape (shape), shape)
+    return Array ([float (x) if _isnumber (x) else x for x in flat], shape)
+
+def array (rows):
+    width = len (rows [0])
+    if any (len (row) != width for row in rows):
+        raise ValueError ("array rows differ in length")
+    return _make ([x for row in rows for x in row], (len (rows), width))
+
+def _broadcast (s1, s2):
+    n = max (len (s1), len (s2))
+    s1 = (1,) * (n - len (s1)) + s1
+    s2 = (1,) * (n - len (s2)) + s2
+    shape = []
+    for a, b in zip (s1, s2):
+        if a != b and a != 1 and b != 1:
+            raise ValueError (f"shapes {s1} and {s2} do not broadcast")
+        shape.append (b if a == 1 else a)
+    return s1, s2, tuple (shape)
+
+# flat indices into an operand of shape s for every element of shape, in order
+def _indices (s, shape):
+    strides = []
+    stride = 1
+    for d in reversed (s):
+        strides.append (stride if d != 1 else 0)
+        stride *= d
+    strides.reverse ()
+    indices = [0]
+    for d, stride in zip (shape, strides):
+        indices = [i + k * stride for i in indices for k in range (d)]
+    return indices
+
+def _binary (name, x, y):
+    ufunc, op = _kernels [name]
+    xa = x.data if isinstance (x, Array) else x
+    ya = y.data if isinstance (y, Array) else y
+    if _np is not None and type (xa) is not list and type (ya) is not list and not isinstance (xa, str) and not isinstance (ya, str):
+        with _np.errstate (all = "ignore"):
+            r = getattr (_np, ufunc) (xa, ya)
+        return Array (r, r.shape)
+    if not isinstance (x, Array):
+        return Array ([_ieee (op, x, b) for b in y.flat ()], y.shape)
+    if not isinstance (y, Array):
+        return Array ([_ieee (op, a, y) for a in x.flat ()], x.shape)
+    if x.shape == y.shape:
+        return Array ([_ieee (op, a, b) for a, b in zip (x.flat (), y.flat ())], x.shape)
+    s1, s2, shape = _broadcast (x.shape, y.shape)
+    xs = x.flat ()
+    ys = y.flat ()
+    return Array ([_ieee (op, xs [i], ys [j]) for i, j in zip (_indices (s1, shape), _indices (s2, shape))], shape)
+
+def _operators (name):
+    return (lambda self, other: _binary (name, self, other),
+            lambda self, other: _binary (name, other, self))
+
+Array.__add__, Array.__radd__ = _operators ("add")
+Array.__sub__, Array.__rsub__ = _operators ("sub")
+Array.__mul__, Array.__rmul__ = _operators ("mul")
+Array.__truediv__, Array.__rtruediv__ = _operators ("div")
+Array.__floordiv__, Array.__rfloordiv__ = _operators ("idiv")
+Array.__mod__, Array.__rmod__ = _operators ("mod")
+Array.__pow__, Array.__rpow__ = _operators ("pow")
+
+# a | b: a single row b goes under a as its next row ({1, 2} | {3, 4} is
+# {1, 2; 3, 4}), an array of a's shape goes behind it as the next layer of
+# depth, and so does one of a's shape without its last dimension
+def pipe (a, b):
+    a = a if isinstance (a, Array) else array ([[a]])
+    b = b if isinstance (b, Array) else array ([[b]])
+    if len (a.shape) == 2 and len (b.shape) == 2 and b.shape [0] == 1 and a.shape [1] == b.shape [1]:
+        return _make (a.flat () + b.flat (), (a.shape [0] + 1, a.shape [1]))
+    if a.shape == b.shape:
+        layers = [a.flat (), b.flat ()]
+        shape = a.shape + (2,)
+    elif a.shape [:-1] == b.shape:
+        depth = a.shape [-1]
+        flat = a.flat ()
+        layers = [flat [k::depth] for k in range (depth)] + [b.flat ()]
+        shape = b.shape + (depth + 1,)
+    else:
+        raise ValueError (f"cannot stack shape {b.shape} onto {a.shape}")
+    return _make ([layer [i] for i in range (len (layers [0])) for layer in layers], shape)
+
+# a rectangle of cells, [A1:B3], its cells in row-major order: a view that
+# holds two corner keys, not the values.  The cells count as read by the
+# formula that made it (so it is recomputed when one changes), their values
+# are fetched when something asks for them.  A view is only copied where it
+# could see its own writes: a block assignment from an overlapping range,
+# or a push, which may keep it past the next recalc ()
+class Range:
+    __slots__ = ("subject", "first", "last")
+
+    def __init__ (self, subject, first, last):
+        c1, c2 = sorted ((first >> _ROWBITS, last >> _ROWBITS))
+        r1, r2 = sorted ((first & _ROWMASK, last & _ROWMASK))
+        self.subject = subject
+        self.first = c1 << _ROWBITS | r1
+        self.last = c2 << _ROWBITS | r2
+
+    @property
+    def shape (self):
+        return ((self.last & _ROWMASK) - (self.first & _ROWMASK) + 1,
+                (self.last >> _ROWBITS) - (self.first >> _ROWBITS) + 1)
+
+    def keys (self):
+        c1, r1 = self.first >> _ROWBITS, self.first & _ROWMASK
+        c2, r2 = self.last >> _ROWBITS, self.last & _ROWMASK
+        return [c << _ROWBITS | r for r in range (r1, r2 + 1) for c in range (c1, c2 + 1)]
+
+    # None for an empty cell
+    def values (self):
+        get = self.subject.cells.get
+        return [get (key) for key in self.keys ()]
+
+    def covers (self, key):
+        return (self.first >> _ROWBITS <= key >> _ROWBITS <= self.last >> _ROWBITS
+                and self.first & _ROWMASK <= key & _ROWMASK <= self.last & _ROWMASK)
+
+    def overlaps (self, other):
+        return (self.subject is other.subject
+                and max (self.first >> _ROWBITS, other.first >> _ROWBITS) <= min (self.last >> _ROWBITS, other.last >> _ROWBITS)
+                and max (self.first & _ROWMASK, other.first & _ROWMASK) <= min (self.last & _ROWMASK, other.last & _ROWMASK))
+
+    # empty cells are 0, as in arithmetic
+    def array (self):
+        return _make ([0 if v is None else v for v in self.values ()], self.shape)
+
+def cellrange (subject, first, last):
+    r = Range (subject, first, last)
+    n = subject.evaluating
+    if n is not None:
+        subject.watchers.watch (n, r.first, r.last)
+    return r
+
+# functions formulas call by name, SQRT (100), sum [A1:A2], sum {a, b}.  A
+# builtin has a scalar implementation, and may have a vector one for Array
+# arguments (a numpy ufunc or reduction over the whole array) and a range one
+# for Range arguments; a call picks one by the shape of its arguments, once,
+# so SQRT over a range of 100k cells is one vectorized call.  Without a range
+# implementation a range is read into an Array, without a vector one an
+# array argument is mapped through the scalar implementation
+class Builtin:
+    __slots__ = ("name", "scalar", "vector", "range")
+
+    def __init__ (self, name, scalar, vector = None, range = None):
+        self.name = name
+        self.scalar = scalar
+        self.vector = vector
+        self.range = range
+
+    def __call__ (self, *args):
+        shape = 0   # 1 with an Array among the arguments, 2 with a Range
+        for x in args:
+            if isinstance (x, Range):
+                shape = 2
+                break
+            if isinstance (x, Array):
+                shape = 1
+        if shape == 2:
+            if self.range is not None:
+                return self.range (*args)
+            args = [x.array () if isinstance (x, Range) else x for x in args]
+        if shape:
+            if self.vector is not None:
+                return self.vector (*args)
+            if len (args) != 1:
+                raise TypeError (f"{self.name} () does not take arrays")
+            return _make ([self.scalar (x) for x in args [0].flat ()], args [0].shape)
+        return self.scalar (*args)
+
+functions = {}
+
+def register (name, scalar, vector = None, range = None):
+    functions [name] = Builtin (name, scalar, vector, range)
+
+# the function a call of name means, names are lower case (the prepass
+# lowers them); only the registered functions are grid builtins
+def builtin (name):
+    f = functions.get (name)
+    if f is None:
+        raise NameError (f"name '{name}' is not defined")
+    return f
+
+def _ufunc (name, scalar):
+    def vector (a):
+        if type (a.data) is list:
+            return _make ([scalar (x) for x in a.data], a.shape)
+        with _np.errstate (all = "ignore"):
+            r = getattr (_np, name) (a.data)
+        return Array (r, r.shape)
+    return vector
+
+for _name, _ufuncname, _scalar in (
+        ("sqrt", "sqrt", _math.sqrt), ("abs", "absolute", abs),
+        ("exp", "exp", _math.exp), ("ln", "log", _math.log), ("log10", "log10", _math.log10),
+        ("sin", "sin", _math.sin), ("cos", "cos", _math.cos), ("tan", "tan", _math.tan),
+        ("int", "floor", _math.floor), ("floor", "floor", _math.floor), ("ceiling", "ceil", _math.ceil)):
+    register (_name, _scalar, _ufunc (_ufuncname, _scalar))
+
+def _elements (args):
+    for x in args:
+        if isinstance (x, Array):
+            yield from x.flat ()
+        elif isinstance (x, Range):
+            yield from x.values ()
+        else:
+            yield x
+
+# aggregates take any mix of values, arrays and ranges; in a range only the
+# numbers count, empty cells and text are skipped.  Those that can be had
+# from a sum and a count (indexed) read ranges from the cell store's column
+# totals instead of their cells
+def _aggregate (name, reduction, fold, indexed = None):
+    def vector (*args):
+        if len (args) == 1 and type (args [0].data) is not list:
+            r = getattr (_np, reduction) (args [0].data)
+            return r.item () if hasattr (r, "item") else r
+        return fold (list (_elements (args)))
+    def ranged (*args):
+        if indexed is not None and all (isinstance (x, Range) for x in args):
+            s = n = 0
+            floats = []
+            for r in args:
+                ts, tn, tf = r.subject.cells.parts (r.first, r.last)
+                s += ts
+                n += tn
+                floats += tf
+            return indexed (_exactsum (s, floats), n)
+        return fold ([x for x in _elements (args) if _isnumber (x)])
+    register (name, lambda *args: fold (args), vector, ranged)
+
+_aggregate ("sum", "sum", sum, lambda s, n: s)
+_aggregate ("min", "min", min)
+_aggregate ("max", "max", max)
+_aggregate ("average", "mean", lambda xs: sum (xs) / len (xs), lambda s, n: s / n)
+_aggregate ("count", "size", len, lambda s, n: n)
+
+register ("len", len, lambda a: _math.prod (a.shape), lambda r: _math.prod (r.shape))
+
+# compact IR emitted by grid-ir.rwr (gridc.py --ir)
+#
+# text, one item per line:
+#   gridir 1          header
+#   k 3               push constant 3
+#   ld 2              push the value of name 2
+#   st 2              pop into name 2
+#   add | sub | mul | div | idiv | mod | pow | pipe   pop two, push the result
+#   mark ... call 4   call name 4 with the values pushed since mark
+#   mark ... row      push the values pushed since mark as one array row
+#   mark ... array    push an array of the rows pushed since mark
+#   print             pop and print (Return)
+#   cell 1 7          pop into cell column 1 (a) row 7
+#   rdcell | stcell   pop row and column number, push the cell / pop a value into it
+#   rdrange           pop two corners (column and row number each), push the Range
+#   stblock           pop two corners, then a value, and write it over the rectangle
+#   spill             pop a corner, then a value, and write it out from there
+#   fn 4 ... end      define function name 4
+#   input 0 5 | output 0 5 | push 0   Input / Output (type constant 5, optional) / push
+#                     (inside fn: parameter / result, push to either stores)
+#   declare 0 5       declare name 0 (For, a typed definition; type constant 5, optional)
+#   check 5           raise unless the value on top is of type constant 5
+#   line 6            the instructions since the previous line marker come from source line 6
+#   const <json>      constant pool, in index order
+#   name <json>       name pool, in index order
+#
+# a name's pool index is also its slot: variables live in a flat list, the
+# pool only names the slots (for errors, and builtins called by name)
+#
+# loadir () resolves marks into argument counts and function bodies into
+# nested instruction lists once, runir () executes the result
+
+import json as _json
+
+K, LD, ST, ADD, SUB, MUL, DIV, IDIV, POW, CALL, PRINT, CELL, FN, INPUT, OUTPUT, PUSH, DECLARE, RDCELL, STCELL, MOD, ROW, ARRAY, PIPE, RDRANGE, STBLOCK, SPILL, CHECK = range (27)
+
+_opcodes = {
+    "k": K, "ld": LD, "st": ST, "add": ADD, "sub": SUB, "mul": MUL, "div": DIV, "idiv": IDIV, "pow": POW, "call": CALL, "print": PRINT,
+    "cell": CELL, "fn": FN, "input": INPUT, "output": OUTPUT, "push": PUSH, "declare": DECLARE,
+    "rdcell": RDCELL, "stcell": STCELL, "mod": MOD, "row": ROW, "array": ARRAY, "pipe": PIPE,
+    "rdrange": RDRANGE, "stblock": STBLOCK, "spill": SPILL, "check": CHECK,
+}
+
+# stack effect of every opcode but CALL, ROW and ARRAY, whose effect depends
+# on how many values they take
+_effect = {
+    K: 1, LD: 1, ST: -1, ADD: -1, SUB: -1, MUL: -1, DIV: -1, IDIV: -1, POW: -1,
+    PRINT: -1, CELL: -1, FN: 0, INPUT: 0, OUTPUT: 0, PUSH: -1, DECLARE: 0,
+    RDCELL: -1, STCELL: -3, MOD: -1, PIPE: -1, RDRANGE: -3, STBLOCK: -5, SPILL: -3, CHECK: 0,
+}
+
+class IRError (Exception):
+    pass
+
+class IRProgram:
+    def __init__ (self, code, lines, consts, names):
+        self.code = code      # [(opcode, a, b)], FN carries (body, body lines) in b
+        self.lines = lines    # source line of each instruction of code
+        self.consts = consts
+        self.names = names
+
+def column_name (n):
+    name = ""
+    while n > 0:
+        n, r = divmod (n - 1, 26)
+        name = chr (97 + r) + name
+    return name
+
+def loadir (text):
+    items = text.split ("\n")
+    if not items or items [0].split () != ["gridir", "1"]:
+        raise IRError ("not gridir 1 text")
+    consts = []
+    names = []
+    top = ([], [])
+    blocks = [top]
+    pending = []   # (block, index) of instructions still waiting for their line marker
+    marks = []
+    depth = 0
+    for item in items [1:]:
+        if item == "":
+            continue
+        op, _, rest = item.partition (" ")
+        if op == "const":
+            consts.append (_json.loads (rest))
+            continue
+        if op == "name":
+            names.append (_json.loads (rest))
+            continue
+        if op == "line":
+            n = int (rest)
+            for block, i in pending:
+                block [1] [i] = n
+            pending = []
+            continue
+        if op == "mark":
+            marks.append (depth)
+            continue
+        if op == "end":
+            if len (blocks) == 1:
+                raise IRError ("end without fn")
+            blocks.pop ()
+            continue
+        if op not in _opcodes:
+            raise IRError (f"unknown instruction {item}")
+        opcode = _opcodes [op]
+        operands = [int (x) for x in rest.split ()]
+        a = operands [0] if operands else -1
+        b = operands [1] if len (operands) > 1 else -1
+        if opcode in (CALL, ROW, ARRAY):
+            b = depth - marks.pop ()
+            depth -= b - 1
+        else:
+            depth += _effect [opcode]
+        code, lines = blocks [-1]
+        if opcode == FN:
+            body = ([], [])
+            code.append ((opcode, a, body))
+            lines.append (0)
+            pending.append ((blocks [-1], len (code) - 1))
+            blocks.append (body)
+            continue
+        code.append ((opcode, a, b))
+        lines.append (0)
+        pending.append ((blocks [-1], len (code) - 1))
+    if len (blocks) != 1:
+        raise IRError ("fn without end")
+    _functions (top [0])
+    return IRProgram (top [0], top [1], consts, names)
+
+# a function's inputs are its parameters and its outputs its result, so its
+# body keeps neither instruction, and a push to either is a plain store
+def _functions (code):
+    for i, (op, a, body) in enumerate (code):
+        if op != FN:
+            continue
+        fcode, flines = body
+        _functions (fcode)
+        inputs = [x for op, x, _ in fcode if op == INPUT]
+        outputs = [x for op, x, _ in fcode if op == OUTPUT]
+        local = set (inputs) | set (outputs)
+        kept = [(ST if op == PUSH and x in local else op, x, y, n)
+                for (op, x, y), n in zip (fcode, flines) if op not in (INPUT, OUTPUT)]
+        code [i] = (FN, a, ([k [:3] for k in kept], [k [3] for k in kept], inputs, outputs))
+
+def _lookup (slots, names, a):
+    value = slots [a]
+    if value is _unset:
+        raise NameError (f"name '{names [a]}' is not defined")
+    return value
+
+# a call of a name that is not a grid function is a call of a builtin
+def _callee (slots, names, a):
+    value = slots [a]
+    if value is _unset:
+        return builtin (names [a])
+    return value
+
+def _execute (program, code, lines, subject, slots):
+    consts = program.consts
+    names = program.names
+    stack = []
+    pc = 0
+    try:
+        for pc, (op, a, b) in enumerate (code):
+            if op == K:
+                stack.append (consts [a])
+            elif op == LD:
+                stack.append (_lookup (slots, names, a))
+            elif op == ST:
+                slots [a] = stack.pop ()
+            elif op == ADD:
+                y = stack.pop ()
+                stack [-1] = stack [-1] + y
+            elif op == SUB:
+                y = stack.pop ()
+                stack [-1] = stack [-1] - y
+            elif op == MUL:
+                y = stack.pop ()
+                stack [-1] = stack [-1] * y
+            elif op == DIV:
+                y = stack.pop ()
+                stack [-1] = stack [-1] / y
+            elif op == IDIV:
+                y = stack.pop ()
+                stack [-1] = stack [-1] // y
+            elif op == POW:
+                y = stack.pop ()
+                stack [-1] = stack [-1] ** y
+            elif op == MOD:
+                y = stack.pop ()
+                stack [-1] = stack [-1] % y
+            elif op == PIPE:
+                y = stack.pop ()
+                stack [-1] = pipe (stack [-1], y)
+            elif op == ROW:
+                row = stack [len (stack) - b:]
+                del stack [len (stack) - b:]
+                stack.append (row)
+            elif op == ARRAY:
+                rows = stack [len (stack) - b:]
+                del stack [len (stack) - b:]
+                stack.append (array (rows))
+            elif op == CALL:
+                args = stack [len (stack) - b:]
+                del stack [len (stack) - b:]
+                stack.append (_callee (slots, names, a) (*args))
+            elif op == PRINT:
+                print (stack.pop ())
+            elif op == CELL:
+                key = a << _ROWBITS | b
+                _claim (subject, key)
+                subject.cells [key] = stack.pop ()
+            elif op == RDCELL:
+                row = stack.pop ()
+                stack [-1] = subject.cells.get (address (stack [-1], row))
+            elif op == RDRANGE:
+                row = stack.pop ()
+                col = stack.pop ()
+                first = stack.pop ()
+                stack [-1] = cellrange (subject, address (stack [-1], first), address (col, row))
+            elif op == STBLOCK:
+                row = stack.pop ()
+                col = stack.pop ()
+                first = stack.pop ()
+                first = address (stack.pop (), first)
+                last = address (col, row)
+                for key in Range (subject, first, last).keys ():
+                    _claim (subject, key)
+                _fill (subject, None, first, last, stack.pop ())
+                subject.touched.clear ()
+            elif op == SPILL:
+                # there are no nodes, a spill is known by its anchor (as
+                # ~anchor, never a node number), so one a function runs
+                # again takes its own extent back first
+                row = stack.pop ()
+                anchor = address (stack.pop (), row)
+                subject.anchors [~anchor] = anchor
+                _respill (subject, ~anchor, stack.pop ())
+                subject.touched.clear ()
+            elif op == STCELL:
+                row = stack.pop ()
+                col = stack.pop ()
+                key = address (col, row)
+                _claim (subject, key)
+                subject.cells [key] = stack.pop ()
+            elif op == FN:
+                slots [a] = _irfunction (program, b, subject, slots)
+            elif op == INPUT:
+                type_name = consts [b] if b >= 0 else None
+                slots [a] = argument (subject, names [a], type_name)
+                declare (subject, a, type_name)
+            elif op == OUTPUT:
+                output (subject, a, consts [b] if b >= 0 else None)
+            elif op == PUSH:
+                push (subject, a, stack.pop ())
+            elif op == DECLARE:
+                declare (subject, a, consts [b] if b >= 0 else None)
+            elif op == CHECK:
+                check (stack [-1], consts [a])
+    except Exception as e:
+        if lines and not getattr (e, "gridline", None):
+            e.gridline = lines [pc]
+            e.add_note (f"at grid line {lines [pc]}")
+        raise
+
+def _irfunction (program, body, subject, slots):
+    code, lines, inputs, outputs = body
+    local = inputs + outputs
+    def function (*args):
+        if len (args) != len (inputs):
+            raise TypeError (f"expected {len (inputs)} arguments, got {len (args)}")
+        # names share slots with the caller's, keep the caller's values
+        saved = [slots [x] for x in local]
+        try:
+            for x, value in zip (inputs, args):
+                slots [x] = value
+            for x in outputs:
+                slots [x] = None
+            _execute (program, code, lines, subject, slots)
+            if len (outputs) == 1:
+                return slots [outputs [0]]
+            if outputs:
+                return tuple (slots [x] for x in outputs)
+            return None
+        finally:
+            for x, value in zip (local, saved):
+                slots [x] = value
+    return function
+
+def runir (program, subject = None):
+    if isinstance (program, str):
+        program = loadir (program)
+    if subject is None:
+        subject = fresh ()
+    # assignments and spills are checked against each other as in the
+    # dependency graph, in program order
+    subject.occupancy = Occupancy ()
+    subject.anchors = {}
+    subject.spilled = {}
+    subject.slots = [_unset] * len (program.names)
+    subject.names = list (program.names)
+    _execute (program, program.code, program.lines, subject, subject.slots)
+    return subject
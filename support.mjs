@@ -8,6 +8,576 @@ function incnl () {
     return `⎩${line}⎭`
 }
 
+// the Program prelude of grid.rwr, emitted once per input even when the
+// input is rewritten a chunk at a time (t2t --stream)
+let preluded = false;
+function prelude () {
+    if (preluded) {
+	return "";
+    }
+    preluded = true;
+    return "\nimport rtlib\nsubject = rtlib.fresh ()";
+}
+
+// variables of the Python backend live in a flat list, slots [i]; the
+// index of every name is fixed here, at compile time, and rtlib keeps the
+// names only as a debug table.  Numbering runs on across the chunks of a
+// streamed input, each chunk's frame () line adding the names it met first.
+//
+// The rewrite of a top-level statement depends on nothing but the statement
+// itself, so that it can be reused as long as its text is unchanged (the
+// memo of t2t_rewrite ()).  Whatever it needs to know about the rest of the
+// program is left in ⟦⟧ markers for pyframe () to settle, in order, once
+// the whole Program has been rewritten:
+//
+//   ⟦#❲x❳⟧           the slot of x
+//   ⟦❲f❳⟧            a call of f, a grid function or a builtin
+//   ⟦r #❲x❳ ~k ❲f❳⟧  a read set: slot x, cell k and whatever f reads
+//   ⟦f❲f❳ ...⟧       the read set of function f, at its definition
+//   ⟦p❲x❳⟧           a function pushes into x
+//   ⟦d❲x❳ t⟧         x is declared as t (or not at all) from here on
+//   ⟦c{...}⟧v⟦/c⟧    v checked against the declared type, if need be
+let slotindex = new Map ();
+let slotnames = [];
+let slotsframed = 0;
+
+function slotof (id) {
+    let name = id.replace (/[❲❳]/g, '');
+    let i = slotindex.get (name);
+    if (i == undefined) {
+	i = slotnames.length;
+	slotnames.push (name);
+	slotindex.set (name, i);
+    }
+    return i;
+}
+
+function pyslot (id) {
+    if (pylocals.has (id)) {
+	return id;
+    }
+    return `slots [⟦#${id}⟧]`;
+}
+
+// types, for eliding constraint checks: a write to a name declared "as T"
+// is checked at run time (rtlib.check ()) only when the type of the value
+// cannot be proven.  Top-level statements are taken in program order, so
+// the type of the last write to an undeclared name is known too, except
+// inside functions, which may run after any later write, and for names a
+// function pushes into.  The types of locals are known while the function
+// is rewritten, those of top-level names only to pyframe ()
+let slotdeclared = new Map ();
+let slotinferred = new Map ();
+let slotpushed = new Set ();
+let localtypes = new Map ();
+
+function typename (tyc) {
+    return tyc.replace (/"/g, '').trim ().toLowerCase ();
+}
+
+const typetoken = /\d+(?:\.\d+)?(?:e[-+]?\d+)?|slots \[⟦#❲[^❳]*❳⟧\]|❲[^❳]*❳|\*\*|\/\/|[-+*\/()⦃⦄ ]/g;
+
+// the type of an expression as emitted by grid.rwr (before cse ()), or
+// null when it depends on something only known at run time; a power is a
+// number only with an integer literal for exponent, (2 - 3) ** 0.5 is
+// complex.  An expression that is a number if the top-level names it reads
+// hold numbers has the list of those names for type
+function exprtype (e) {
+    if (/^"[^"]*"$/.test (e)) {
+	return 'text';
+    }
+    if (e.includes ('⦅') || e.includes ('"') || e.replace (typetoken, '') != '') {
+	return null;
+    }
+    if (/\*\*(?!\d+(?![.\de]))/.test (e)) {
+	return null;
+    }
+    let names = [];
+    for (let m of e.matchAll (/slots \[⟦#(❲[^❳]*❳)⟧\]|(❲[^❳]*❳)/g)) {
+	if (m [1] != undefined) {
+	    names.push (m [1]);
+	} else if (localtypes.get (m [2]) != 'number') {
+	    return null;
+	}
+    }
+    return (names.length == 0) ? 'number' : names;
+}
+
+// e written to a local declared as declared, or to the top-level name
+// target, whose declared type pyframe () knows
+function checked (e, declared, target = '') {
+    let value = cse (e);
+    let type = exprtype (e);
+    if (target == '' && (!declared || !Array.isArray (type))) {
+	return (declared && type != declared) ? `rtlib.check (${value}, "${declared}")` : value;
+    }
+    let check = JSON.stringify ({ target, declared, type, inside: pyinside });
+    return `⟦c${check}⟧${value}⟦/c⟧`;
+}
+
+// `target = value` for a Definition, Binding or For initializer
+function pyassign (id, e, tyc = '') {
+    let target = pyslot (id);
+    if (pylocals.has (id)) {
+	let declared = localtypes.get (id) || typename (tyc);
+	let value = checked (e, declared);
+	let type = exprtype (e);
+	localtypes.set (id, declared || (Array.isArray (type) ? null : type));
+	return `${target} = ${value}`;
+    }
+    let declaration = '';
+    if (tyc != '') {
+	declaration = `⟦d${id} ${typename (tyc)}⟧rtlib.declare (subject, ⟦#${id}⟧,${tyc})\n`;
+    }
+    return `${declaration}rtlib.formula (subject, ⟦#${id}⟧, ${pyreads (e)}, lambda: ${checked (e, null, id)})`;
+}
+
+// top-level definitions, cell assignments and Returns are nodes of the
+// dependency graph rtlib.recalc () evaluates, each with the slots it reads:
+// those in the expression and those read by the functions it calls.  A
+// function may be called above its definition, or by itself, so the calls
+// stay in the set as names (❲f❳) until pyframe () has seen every function
+let functionreads = new Map ();
+
+function readset (e) {
+    let reads = new Set ();
+    for (let m of e.matchAll (/slots \[⟦#(❲[^❳]*❳)⟧\]|rtlib\.read \(subject, (\d+)\)|⦅⟦(❲[^❳]*❳)⟧/g)) {
+	if (m [1] != undefined) {
+	    reads.add (`#${m [1]}`);
+	} else if (m [2] != undefined) {
+	    reads.add (`~${m [2]}`);
+	} else {
+	    reads.add (m [3]);
+	}
+    }
+    return reads;
+}
+
+function pyreads (e) {
+    return `⟦r${[...readset (e)].map ((r) => ` ${r}`).join ('')}⟧`;
+}
+
+// slots first, in order, then cells (rtlib.read (subject, key)), listed as
+// ~key
+function pyreadtuple (reads) {
+    reads = [...reads];
+    let slots = reads.filter ((r) => typeof r == 'number').sort ((a, b) => a - b);
+    reads = [...slots, ...reads.filter ((r) => typeof r != 'number').sort ()];
+    return (reads.length == 1) ? `(${reads [0]},)` : `(${reads.join (', ')})`;
+}
+
+// reads with every slot numbered and every function call replaced by what
+// the function reads, through the functions it calls in turn; a name that
+// is not a grid function is a builtin, which reads nothing
+function resolvereads (reads, seen = new Set ()) {
+    let resolved = new Set ();
+    for (let r of reads) {
+	if (typeof r == 'string' && r.startsWith ('#')) {
+	    resolved.add (slotof (r.slice (1)));
+	} else if (typeof r != 'string' || !r.startsWith ('❲')) {
+	    resolved.add (r);
+	} else if (functionreads.has (r) && !seen.has (r)) {
+	    seen.add (r);
+	    for (let i of resolvereads (functionreads.get (r), seen)) {
+		resolved.add (i);
+	    }
+	}
+    }
+    return resolved;
+}
+
+// an interpolated address ([A{n}], [{i :A}5]) is only known at run time,
+// rtlib.cellat () computes it whenever the node is evaluated
+function pycell (cell, e) {
+    if (!/^\d+$/.test (cell)) {
+	return `rtlib.cellat (subject, ${pyreads (cell + e)}, lambda: ${cell}, lambda: ${cse (e)})`;
+    }
+    return `rtlib.cell (subject, ${cell}, ${pyreads (e)}, lambda: ${cse (e)})`;
+}
+
+// [A1:C2] := e writes the whole block whenever the node is evaluated
+function pyblock (first, last, e) {
+    return `rtlib.cellblock (subject, ${pyreads (e)}, ${first}, ${last}, lambda: ${cse (e)})`;
+}
+
+// [^B2] := e spills from B2 as far as the value's shape reaches
+function pyspill (anchor, e) {
+    return `rtlib.spill (subject, ${pyreads (e)}, ${anchor}, lambda: ${cse (e)})`;
+}
+
+function pyeffect (e) {
+    return `rtlib.effect (subject, ${pyreads (e)}, lambda: print (${cse (e)}))`;
+}
+
+// For with a value is a typed assignment; without one only the
+// declaration is left, to be checked at run time on later writes
+function pyfor (id, tyc, init) {
+    if (init != '') {
+	return pyassign (id, init, tyc);
+    }
+    return `⟦d${id}${tyc && ` ${typename (tyc)}`}⟧rtlib.declare (subject, ⟦#${id}⟧,${tyc || ' None'})`;
+}
+
+// a top-level Input takes the next of the run's arguments, as a number
+// when it is declared one
+function pyargument (id, tyc) {
+    return `⟦d${id}${tyc && ` ${typename (tyc)}`}⟧rtlib.input (subject, ⟦#${id}⟧,${tyc || ' None'})`;
+}
+
+// Define ... as Function: Inputs become positional parameters and Outputs
+// plain locals returned at the end (a tuple when there are several), so a
+// call costs what a Python call costs.  Only a push to a name that is
+// neither goes through rtlib.push () into the caller's bindings
+let pylocals = new Set ();
+let pyinputs = [];
+let pyoutputs = [];
+let pyinside = false;
+let pyfunctionreads = new Set ();
+
+function pyenter (id) {
+    pylocals = new Set ();
+    pyinputs = [];
+    pyoutputs = [];
+    localtypes = new Map ();
+    pyfunctionreads = new Set ();
+    pyinside = (id != '');
+    return id;
+}
+
+// arguments are dynamic values, a typed Input keeps its run-time guard
+function pyinput (id, tyc) {
+    pylocals.add (id);
+    pyinputs.push (id);
+    if (tyc == '') {
+	return '';
+    }
+    localtypes.set (id, typename (tyc));
+    return `${id} = rtlib.check (${id}, "${typename (tyc)}")`;
+}
+
+function pyoutput (id, tyc) {
+    pylocals.add (id);
+    pyoutputs.push (id);
+    if (tyc != '') {
+	localtypes.set (id, typename (tyc));
+    }
+    return `${id} = None`;
+}
+
+function pypush (id, e) {
+    for (let r of readset (e)) {
+	pyfunctionreads.add (r);
+    }
+    if (pylocals.has (id)) {
+	return `${id} = ${checked (e, localtypes.get (id))}`;
+    }
+    return `⟦p${id}⟧rtlib.push (subject, ⟦#${id}⟧, ${checked (e, null, id)})`;
+}
+
+function pyfunction (id, eol, body, idend) {
+    let ret = '\npass';
+    if (pyoutputs.length == 1) {
+	ret = `\nreturn ${pyoutputs [0]}`;
+    } else if (pyoutputs.length > 1) {
+	ret = `\nreturn (${pyoutputs.join (', ')})`;
+    }
+    let params = pyinputs.join (', ');
+    let reads = [...pyfunctionreads].map ((r) => ` ${r}`).join ('');
+    pyenter ('');
+    return `⟦f${id}${reads}⟧def ${id} (${params}):${eol}⤷\n${body}${ret}\n#end ${idend}⤶`;
+}
+
+// a call of a grid function is a plain Python call; any other name is a
+// builtin from rtlib's registry, which picks the function's scalar, vector
+// or range code once per call, by the shape of the arguments.  Which one it
+// is, pyframe () decides, a function may be defined further down
+function pycall (id, args) {
+    return `⟦${id}⟧ (${args})`;
+}
+
+function pycallee (id) {
+    return functionreads.has (id) ? id : `rtlib.builtin ("${id.slice (1, -1)}")`;
+}
+
+// the type pyframe () has for a top-level name at this point of the program
+function nametype (name, inside) {
+    let declared = slotdeclared.get (name);
+    if (declared || inside || slotpushed.has (name)) {
+	return declared || null;
+    }
+    return slotinferred.get (name) || null;
+}
+
+// the check a ⟦c⟧ marker asks for, given what is known about the names so
+// far: the text that opens it, and the declared type it closes with, if any
+function pycheck (check) {
+    let declared = check.declared || slotdeclared.get (check.target) || null;
+    let type = check.type;
+    if (Array.isArray (type)) {
+	type = type.every ((name) => nametype (name, check.inside) == 'number') ? 'number' : null;
+    }
+    if (check.target != '' && !check.inside) {
+	slotinferred.set (check.target, declared || type);
+    }
+    return (declared && type != declared) ? declared : null;
+}
+
+// a ⟦d⟧ marker: a new declaration, or none, and no value known yet
+function pydeclare (marker) {
+    let [name, type] = marker.split (' ');
+    if (type != undefined) {
+	slotdeclared.set (name, type);
+    }
+    slotinferred.delete (name);
+}
+
+// the body of a Program, preceded by the frame holding its variables and
+// followed by the evaluation of the nodes it defined.  The functions and
+// the names they push into are gathered first, then the slots are numbered
+// in order of appearance, and the rest of the markers are settled in
+// program order
+function pyframe (body) {
+    let defined = [];
+    body = body.replace (/⟦([fp])(❲[^❳]*❳)([^⟧]*)⟧/g, (whole, kind, id, reads) => {
+	if (kind == 'p') {
+	    slotpushed.add (id);
+	} else {
+	    functionreads.set (id, new Set (reads.split (' ').filter ((r) => r != '')));
+	    defined.push (id);
+	}
+	return '';
+    });
+    for (let m of body.matchAll (/⟦#(❲[^❳]*❳)⟧/g)) {
+	slotof (m [1]);
+    }
+    for (let id of defined) {
+	functionreads.set (id, resolvereads (functionreads.get (id), new Set ([id])));
+    }
+    let checks = [];
+    body = body.replace (/⟦(#|r|d|c|\/c|(?=❲))([^⟧]*)⟧/g, (whole, kind, rest) => {
+	switch (kind) {
+	case '#':
+	    return `${slotof (rest)}`;
+	case 'r':
+	    return pyreadtuple (resolvereads (rest.split (' ').filter ((r) => r != '')));
+	case 'd':
+	    pydeclare (rest);
+	    return '';
+	case 'c':
+	    checks.push (pycheck (JSON.parse (rest)));
+	    return checks [checks.length - 1] ? 'rtlib.check (' : '';
+	case '/c': {
+	    let declared = checks.pop ();
+	    return declared ? `, "${declared}")` : '';
+	}
+	default:
+	    return pycallee (rest);
+	}
+    });
+    let first = slotsframed;
+    let names = slotnames.slice (first).map ((n) => JSON.stringify (n)).join (', ');
+    slotsframed = slotnames.length;
+    return `\nslots = rtlib.frame (subject, ${first}, [${names}])${body}\nrtlib.recalc (subject)`;
+}
+
+// constant and name pools of the IR backend (grid-ir.rwr); instructions
+// refer to entries by index, the pools are emitted after the instructions
+let irconsts = [];
+let irnames = [];
+let irindex = new Map ();
+
+function irintern (pool, key, text) {
+    let i = irindex.get (key);
+    if (i == undefined) {
+	i = pool.length;
+	pool.push (text);
+	irindex.set (key, i);
+    }
+    return i;
+}
+
+// as JSON: no leading zeros
+function irnumber (numeral) {
+    let text = /[.e]/.test (numeral) ? numeral.replace (/^0+(?=\d)/, '') : BigInt (numeral).toString ();
+    return irintern (irconsts, `k${text}`, text);
+}
+
+function irop (op) {
+    return { '+': 'add', '-': 'sub', '*': 'mul', '/': 'div', '\\': 'idiv', '^': 'pow', 'mod': 'mod' } [op];
+}
+
+// grid's \ is Python's //, mod is %
+function pyop (op) {
+    return { '\\': '//', 'mod': '%' } [op] || op;
+}
+
+function irstring (s) {
+    let text = JSON.stringify (s);
+    return irintern (irconsts, `k${text}`, text);
+}
+
+function irname (s) {
+    return irintern (irnames, `n${s}`, JSON.stringify (s));
+}
+
+// column letters to a column number, a = 1, z = 26, aa = 27
+function ircolumn (letters) {
+    let n = 0;
+    for (let c of letters.toLowerCase ()) {
+	n = n * 26 + c.charCodeAt (0) - 96;
+    }
+    return n;
+}
+
+// the packed key of a cell, column << 32 | row, as rtlib.CellStore uses it
+function cellkey (letters, digits) {
+    return ((BigInt (ircolumn (letters)) << 32n) | BigInt (digits)).toString ();
+}
+
+function irpools () {
+    return irconsts.map ((c) => `\nconst ${c}`).join ('') + irnames.map ((n) => `\nname ${n}`).join ('');
+}
+
+// types in the IR backend, as pyframe () keeps them for the Python one: a
+// write to a name declared "as T" gets a check instruction unless the value
+// is known to be a T.  The IR runs in program order, so only the functions
+// defined above a statement can have pushed into the names it reads.  Names
+// are pool indexes, a type constraint (" 5") the index of the type's name
+let irdeclared = new Map ();
+let irinferred = new Map ();
+let irpushed = new Set ();
+let irlocals = null;
+
+function irtype (tyc) {
+    return (tyc == '') ? null : JSON.parse (irconsts [+tyc]);
+}
+
+function irnametype (id) {
+    if (irlocals != null && irlocals.has (id)) {
+	return irlocals.get (id);
+    }
+    let declared = irdeclared.get (id);
+    if (declared || irlocals != null || irpushed.has (id)) {
+	return declared || null;
+    }
+    return irinferred.get (id) || null;
+}
+
+function irnumeric (k) {
+    return !irconsts [k].startsWith ('"');
+}
+
+// the type of an expression's instructions, null when only known at run
+// time; a power is a number only with an integer literal for exponent
+function irexprtype (e) {
+    let code = e.split ('\n').filter ((op) => op != '').map ((op) => op.split (' '));
+    if (code.length == 1 && code [0] [0] == 'k' && !irnumeric (+code [0] [1])) {
+	return 'text';
+    }
+    for (let [i, [op, a]] of code.entries ()) {
+	if (op == 'k' && irnumeric (+a) || op == 'ld' && irnametype (a) == 'number') {
+	    continue;
+	}
+	if (op == 'pow' && code [i - 1] [0] == 'k' && /^\d+$/.test (irconsts [+code [i - 1] [1]])) {
+	    continue;
+	}
+	if (!['add', 'sub', 'mul', 'div', 'idiv', 'mod'].includes (op)) {
+	    return null;
+	}
+    }
+    return 'number';
+}
+
+function ircheck (e, declared) {
+    if (declared && irexprtype (e) != declared) {
+	return `\ncheck ${irstring (declared)}`;
+    }
+    return '';
+}
+
+// a top-level write: a Definition, Binding or For initializer
+function irstore (e, id, tyc = '') {
+    let declaration = '';
+    if (tyc != '') {
+	irdeclared.set (id, irtype (tyc));
+	declaration = `\ndeclare ${id}${tyc}`;
+    }
+    let declared = irdeclared.get (id) || null;
+    let check = ircheck (e, declared);
+    irinferred.set (id, declared || irexprtype (e));
+    return `${declaration}${e}${check}\nst ${id}`;
+}
+
+function irfor (id, tyc, init) {
+    if (tyc != '') {
+	irdeclared.set (id, irtype (tyc));
+    }
+    irinferred.delete (id);
+    let declaration = `\ndeclare ${id}${tyc}`;
+    return (init == '') ? declaration : declaration + irstore (init, id, '');
+}
+
+function irargument (id, tyc) {
+    if (tyc != '') {
+	irdeclared.set (id, irtype (tyc));
+    }
+    irinferred.delete (id);
+    return `\ninput ${id}${tyc}`;
+}
+
+function irenter (id) {
+    irlocals = new Map ();
+    return id;
+}
+
+// inside a function a typed Input is checked on entry, a push to a typed
+// local when it must be; a push to any other name is checked at run time
+// by rtlib.push ()
+function irinput (id, tyc) {
+    irlocals.set (id, irtype (tyc));
+    let check = (tyc == '') ? '' : `\nld ${id}\ncheck${tyc}\nst ${id}`;
+    return `\ninput ${id}${tyc}${check}`;
+}
+
+function iroutput (id, tyc) {
+    irlocals.set (id, irtype (tyc));
+    return `\noutput ${id}${tyc}`;
+}
+
+function irpush (e, id) {
+    if (irlocals.has (id)) {
+	return `${e}${ircheck (e, irlocals.get (id))}\npush ${id}`;
+    }
+    irpushed.add (id);
+    return `${e}\npush ${id}`;
+}
+
+function irfunction (id, eol, body) {
+    irlocals = null;
+    return `\nfn ${id}${eol}${body}\nend`;
+}
+
+// called by the t2t worker before each independent input
+function resetsupport () {
+    line = 0;
+    preluded = false;
+    slotindex = new Map ();
+    slotnames = [];
+    slotsframed = 0;
+    pyenter ('');
+    slotdeclared = new Map ();
+    slotinferred = new Map ();
+    slotpushed = new Set ();
+    functionreads = new Map ();
+    irconsts = [];
+    irnames = [];
+    irindex = new Map ();
+    irdeclared = new Map ();
+    irinferred = new Map ();
+    irpushed = new Set ();
+    irlocals = null;
+}
+
 // semantic checks
 function semcheckideq (id1, id2, line) {
     if (id1 != id2) {
@@ -15,3 +585,515 @@ function semcheckideq (id1, id2, line) {
     }
     return "";
 }
+
+// grid-opt.rwr
+
+// constant folding: a op b becomes one number when both are number literals
+// and the result is exactly what Python would compute at run time, else the
+// text is left alone; integers are exact (BigInt), floats are IEEE doubles on
+// both sides, ^ of floats is left to Python's pow (), and negative results
+// are kept unfolded because grid has no negative literals
+const numeral = /^\d+(\.\d+)?(e[+-]?\d+)?$/;
+
+function isfloat (numeral) {
+    return /[.e]/.test (numeral);
+}
+
+function foldnumbers (a, op, b) {
+    if (!isfloat (a) && !isfloat (b) && op != '/') {
+	let x = BigInt (a);
+	let y = BigInt (b);
+	let r;
+	if (op == '\\' || op == 'mod') {
+	    // both are >= 0, so truncation is Python's floor division
+	    return (y == 0n) ? null : ((op == 'mod') ? x % y : x / y).toString ();
+	} else if (op == '+') {
+	    r = x + y;
+	} else if (op == '-') {
+	    r = x - y;
+	} else if (op == '*') {
+	    r = x * y;
+	} else {
+	    if (y > 256n) {
+		return null;
+	    }
+	    r = x ** y;
+	}
+	return (r < 0n) ? null : r.toString ();
+    }
+    if (op == '^' || op == '\\' || op == 'mod') {
+	return null;
+    }
+    // int / int is rounded once in Python, from the exact quotient; doubles
+    // only agree when both operands convert exactly
+    if (op == '/' && !isfloat (a) && !isfloat (b) && (BigInt (a) > 2n ** 53n || BigInt (b) > 2n ** 53n)) {
+	return null;
+    }
+    let x = Number (a);
+    let y = Number (b);
+    if (op == '/' && y == 0) {
+	// leave the ZeroDivisionError to run time
+	return null;
+    }
+    let r = (op == '+') ? x + y : (op == '-') ? x - y : (op == '*') ? x * y : x / y;
+    if (!Number.isFinite (r) || r < 0) {
+	return null;
+    }
+    let text = String (r);
+    return isfloat (text) ? text : `${text}.0`;
+}
+
+function fold (a, op, b) {
+    if (numeral.test (a) && numeral.test (b)) {
+	let r = foldnumbers (a, op, b);
+	if (r != null) {
+	    return r;
+	}
+    }
+    return `${a}${op}${b}`;
+}
+
+// parentheses around a single number or name are not needed
+function unparen (e) {
+    if (numeral.test (e) || /^❲[^❲❳]*❳$/.test (e)) {
+	return e;
+    }
+    return `(${e})`;
+}
+
+// evaluation order: every top-level statement starts with ⦉ and every
+// name it defines is marked ⦗❲name❳⦘ (: definitions, Let bindings, For with
+// an initial value, Define, Input).  schedule () reorders the statements so
+// that each one comes after the statements defining the names it uses, a
+// use before any definition waiting for the first definition further down.
+// Otherwise source order is kept: statements that define the same name,
+// write the same cell, call a function, Return or Input keep their
+// relative order, and a use keeps ahead of a later redefinition.  Statements caught
+// in a cycle, or using a name their own statement defines later (Let y = x
+// AND x = 2), stay where they are, after everything that can be scheduled;
+// semcheckcycles () rejects those.  Names defined nowhere are left to the
+// run time.  Only the statements of one input are seen, a stream chunk or
+// a Test block at a time
+function scheduleunits (text) {
+    let units = [];
+    let current = '';
+    for (let piece of text.split ('⦉').slice (1)) {
+	current += piece;
+	// an assignment has no EOL of its own, it travels with the next line's
+	if (current.endsWith ('⎭')) {
+	    units.push (current);
+	    current = '';
+	}
+    }
+    if (current != '') {
+	units.push (current);
+    }
+    return units;
+}
+
+const scheduletoken = /\[\^?❲[^❳]*❳(?::❲[^❳]*❳)?\]|(⦗)?❲([^❳]*)❳/g;
+
+// [❲a❳{...}] or [{...}5], a cell only known at run time, or a range
+// [❲a1❳:❲b2❳] or spill [^❲b2❳], taken to be any cell as well
+const interpolated = /\[❲[^❳]*❳\{|\[\{|\[❲[^❳]*❳:|\[\^/;
+
+function scheduleinfo (unit) {
+    let defs = [];
+    let uses = [];
+    let cells = [];
+    // a binding takes effect after its own expression, so in : x = x or
+    // Let y = x AND x = 2 the statement uses the x it defines; names inside
+    // a function definition are its own
+    let local = unit.startsWith ('Define');
+    let defined = [];
+    let pending = null;
+    let m;
+    scheduletoken.lastIndex = 0;
+    while ((m = scheduletoken.exec (unit)) != null) {
+	if (m [2] == undefined) {
+	    if (!cells.includes (m [0])) {
+		cells.push (m [0]);
+	    }
+	} else if (m [1] != undefined) {
+	    defs.push (m [2]);
+	    if (pending != null) {
+		defined.push (pending);
+	    }
+	    pending = m [2];
+	} else if (!local && !defined.includes (m [2]) && !uses.includes (m [2])) {
+	    uses.push (m [2]);
+	}
+    }
+    // an interpolated cell ([❲a❳{...}], [{...}5]) or a range may be any cell;
+    // Inputs take the run's arguments in order
+    let effect = unit.includes ('❳(') || unit.startsWith ('Return') || unit.startsWith ('Input') || interpolated.test (unit);
+    return { defs: defs, uses: uses, cells: cells, effect: effect };
+}
+
+// the statements each name is defined by, in source order
+function definers (info) {
+    let ds = new Map ();
+    info.forEach ((u, i) => u.defs.forEach ((name) => {
+	if (!ds.has (name)) {
+	    ds.set (name, []);
+	}
+	let list = ds.get (name);
+	if (list [list.length - 1] != i) {
+	    list.push (i);
+	}
+    }));
+    return ds;
+}
+
+// the statement a use of name in statement i reads: the nearest definition
+// above it, else the first one below; i itself when the statement's own
+// definition is the only candidate (a cycle of one)
+function provider (ds, i) {
+    let lo = 0;
+    let hi = ds.length;
+    while (lo < hi) {
+	let mid = (lo + hi) >> 1;
+	if (ds [mid] < i) {
+	    lo = mid + 1;
+	} else {
+	    hi = mid;
+	}
+    }
+    return (lo > 0) ? ds [lo - 1] : ds [0];
+}
+
+// for every statement, the statements whose definitions it reads
+function references (info) {
+    let ds = definers (info);
+    return info.map ((u, i) => {
+	let refs = [];
+	for (let name of u.uses) {
+	    let list = ds.get (name);
+	    if (list != undefined) {
+		refs.push ({ name: name, from: provider (list, i), definers: list });
+	    }
+	}
+	return refs;
+    });
+}
+
+function schedule (text) {
+    let units = scheduleunits (text);
+    let info = units.map (scheduleinfo);
+    let refs = references (info);
+    let n = units.length;
+    let after = units.map (() => []);
+    let waiting = new Array (n).fill (0);
+    let blocked = new Array (n).fill (false);
+    let edge = (from, to) => {
+	if (from != to) {
+	    after [from].push (to);
+	    waiting [to] += 1;
+	}
+    };
+    // consecutive statements sharing a name, a cell or having effects keep their order
+    let chains = new Map ();
+    let chain = (key, i) => {
+	if (chains.has (key)) {
+	    edge (chains.get (key), i);
+	}
+	chains.set (key, i);
+    };
+    info.forEach ((u, i) => {
+	u.defs.forEach ((name) => chain (`n${name}`, i));
+	u.cells.forEach ((cell) => chain (`c${cell}`, i));
+	if (u.effect) {
+	    chain ('effect', i);
+	}
+    });
+    refs.forEach ((rs, i) => {
+	for (let r of rs) {
+	    if (r.from == i) {
+		blocked [i] = true;
+		continue;
+	    }
+	    edge (r.from, i);
+	    // a use stays ahead of the redefinitions below it
+	    for (let k = r.definers.length - 1; k >= 0 && r.definers [k] > i; k--) {
+		if (r.definers [k] != r.from) {
+		    edge (i, r.definers [k]);
+		}
+	    }
+	}
+    });
+    // Kahn's algorithm, always taking the ready statement that comes first in the source
+    let heap = [];
+    let heappush = (x) => {
+	heap.push (x);
+	let k = heap.length - 1;
+	while (k > 0 && heap [(k - 1) >> 1] > heap [k]) {
+	    [heap [k], heap [(k - 1) >> 1]] = [heap [(k - 1) >> 1], heap [k]];
+	    k = (k - 1) >> 1;
+	}
+    };
+    let heappop = () => {
+	let top = heap [0];
+	let last = heap.pop ();
+	if (heap.length > 0) {
+	    heap [0] = last;
+	    let k = 0;
+	    for (;;) {
+		let c = 2 * k + 1;
+		if (c >= heap.length) {
+		    break;
+		}
+		if (c + 1 < heap.length && heap [c + 1] < heap [c]) {
+		    c += 1;
+		}
+		if (heap [k] <= heap [c]) {
+		    break;
+		}
+		[heap [k], heap [c]] = [heap [c], heap [k]];
+		k = c;
+	    }
+	}
+	return top;
+    };
+    for (let i = 0; i < n; i++) {
+	if (waiting [i] == 0 && !blocked [i]) {
+	    heappush (i);
+	}
+    }
+    let order = [];
+    let placed = new Array (n).fill (false);
+    while (heap.length > 0) {
+	let i = heappop ();
+	order.push (i);
+	placed [i] = true;
+	for (let j of after [i]) {
+	    waiting [j] -= 1;
+	    if (waiting [j] == 0 && !blocked [j]) {
+		heappush (j);
+	    }
+	}
+    }
+    for (let i = 0; i < n; i++) {
+	if (!placed [i]) {
+	    order.push (i);
+	}
+    }
+    return order.map ((i) => units [i]).join ('').replace (/[⦗⦘]/g, '');
+}
+
+// the strongly connected components of a graph given as successor lists,
+// Tarjan's algorithm without recursion so that long chains of definitions
+// do not overflow the stack
+function stronglyconnected (successors) {
+    let n = successors.length;
+    let index = new Array (n).fill (-1);
+    let low = new Array (n).fill (0);
+    let onstack = new Array (n).fill (false);
+    let stack = [];
+    let components = [];
+    let counter = 0;
+    for (let root = 0; root < n; root++) {
+	if (index [root] != -1) {
+	    continue;
+	}
+	let work = [[root, 0]];
+	index [root] = low [root] = counter++;
+	stack.push (root);
+	onstack [root] = true;
+	while (work.length > 0) {
+	    let frame = work [work.length - 1];
+	    let v = frame [0];
+	    if (frame [1] < successors [v].length) {
+		let w = successors [v] [frame [1]++];
+		if (index [w] == -1) {
+		    index [w] = low [w] = counter++;
+		    stack.push (w);
+		    onstack [w] = true;
+		    work.push ([w, 0]);
+		} else if (onstack [w]) {
+		    low [v] = Math.min (low [v], index [w]);
+		}
+		continue;
+	    }
+	    work.pop ();
+	    if (work.length > 0) {
+		let u = work [work.length - 1] [0];
+		low [u] = Math.min (low [u], low [v]);
+	    }
+	    if (low [v] == index [v]) {
+		let component = [];
+		let w;
+		do {
+		    w = stack.pop ();
+		    onstack [w] = false;
+		    component.push (w);
+		} while (w != v);
+		components.push (component);
+	    }
+	}
+    }
+    return components;
+}
+
+// semantic check: a definition that depends on itself, directly (: x = x)
+// or through others (: y = x, : x = y, or Let y = x AND x = 2), is
+// rejected, every such cycle reported at once with its source lines.
+// Statements are marked as for schedule ()
+function semcheckcycles (text) {
+    let units = scheduleunits (text);
+    let info = units.map (scheduleinfo);
+    let refs = references (info);
+    let components = stronglyconnected (refs.map ((rs) => rs.map ((r) => r.from)));
+    let errors = [];
+    for (let component of components) {
+	let members = new Set (component);
+	if (component.length == 1 && !refs [component [0]].some ((r) => r.from == component [0])) {
+	    continue;
+	}
+	component.sort ((a, b) => a - b);
+	let names = new Set ();
+	let lines = [];
+	for (let i of component) {
+	    for (let r of refs [i]) {
+		if (members.has (r.from)) {
+		    names.add (r.name);
+		}
+	    }
+	    let m = units [i].match (/⎩(\d+)⎭/);
+	    if (m) {
+		lines.push (m [1]);
+	    }
+	}
+	errors.push (`circular definition of ${[...names].join (', ')} at line${lines.length == 1 ? '' : 's'} ${lines.join (', ')}`);
+    }
+    if (errors.length > 0) {
+	throw new Error (errors.join ('\n'));
+    }
+    return text.replace (/[⦉⦗⦘]/g, '');
+}
+
+// dead cells: every assignment is wrapped as ⟦cell⟧text⟦⟧ so that
+// deadcells () can see the whole program; an assignment is dropped when a
+// later one overwrites the same cell and nothing up to that point (no
+// function call, no mention of the cell, no interpolated cell or range)
+// can observe the first value
+function assigned (cell, text) {
+    return `⟦${cell}⟧${text}⟦⟧`;
+}
+
+function deadcells (text) {
+    let marked = /⟦([^⟧]*)⟧([\s\S]*?)⟦⟧/g;
+    let assignments = [...text.matchAll (marked)];
+    let observes = (t, cell) => /❳\(/.test (t) || interpolated.test (t) || t.includes (cell);
+    let dead = new Set ();
+    for (let i = 0; i < assignments.length; i++) {
+	let [whole, cell, body] = assignments [i];
+	if (/❳\(/.test (body) || interpolated.test (body)) {
+	    continue;
+	}
+	let end = assignments [i].index + whole.length;
+	for (let later of assignments.slice (i + 1)) {
+	    let expr = later [2].slice (later [1].length);
+	    if (observes (text.slice (end, later.index), cell) || observes (expr, cell)) {
+		break;
+	    }
+	    if (later [1] == cell) {
+		dead.add (i);
+		break;
+	    }
+	    end = later.index + later [0].length;
+	}
+    }
+    let n = 0;
+    return text.replace (marked, (whole, cell, body) => dead.has (n++) ? '' : body);
+}
+
+// common subexpressions, grid.rwr: operator expressions are emitted as ⦃...⦄
+// and calls as ⦅...⦆; cse () takes a whole statement's expression and, if
+// it makes no call, evaluates each operator expression that occurs more
+// than once only once, through an assignment expression:
+// (a+b)*(a+b) becomes ((_cse1 := a+b))*(_cse1).  Python evaluates operands
+// left to right, so the first occurrence always runs first
+function csetree (text) {
+    let root = { call: false, parts: [] };
+    let stack = [root];
+    for (let c of text) {
+	let top = stack [stack.length - 1];
+	if (c == '⦃' || c == '⦅') {
+	    let node = { call: c == '⦅', parts: [] };
+	    top.parts.push (node);
+	    stack.push (node);
+	} else if (c == '⦄' || c == '⦆') {
+	    stack.pop ();
+	} else if (typeof top.parts [top.parts.length - 1] == 'string') {
+	    top.parts [top.parts.length - 1] += c;
+	} else {
+	    top.parts.push (c);
+	}
+    }
+    return root;
+}
+
+function cseflat (node) {
+    return node.parts.map ((p) => typeof p == 'string' ? p : cseflat (p)).join ('');
+}
+
+function cse (text) {
+    let root = csetree (text);
+    if (text.includes ('⦅')) {
+	// a call can push into the slots the expression reads
+	return cseflat (root);
+    }
+    let nodes = [];
+    let count = new Map ();
+    // a node is pure when neither it nor anything inside it is a call
+    let collect = (node) => {
+	node.pure = !node.call;
+	for (let p of node.parts) {
+	    if (typeof p != 'string') {
+		node.pure = collect (p) && node.pure;
+	    }
+	}
+	node.key = cseflat (node);
+	if (node.pure) {
+	    nodes.push (node);
+	    count.set (node.key, (count.get (node.key) || 0) + 1);
+	}
+	return node.pure;
+    };
+    root.parts.forEach ((p) => typeof p != 'string' && collect (p));
+    // a repeated expression is reused whole, so whatever is inside its later
+    // copies is not evaluated there; settle the largest repeats first
+    let drop = (node) => node.parts.forEach ((p) => {
+	if (typeof p != 'string') {
+	    p.dropped = true;
+	    count.set (p.key, count.get (p.key) - 1);
+	    drop (p);
+	}
+    });
+    let kept = new Set ();
+    for (let node of nodes.sort ((a, b) => b.key.length - a.key.length)) {
+	if (node.dropped || count.get (node.key) < 2) {
+	    continue;
+	}
+	if (kept.has (node.key)) {
+	    drop (node);
+	} else {
+	    kept.add (node.key);
+	}
+    }
+    let names = new Map ();
+    let parts = (node) => node.parts.map ((p) => typeof p == 'string' ? p : render (p)).join ('');
+    let render = (node) => {
+	if (!node.pure || count.get (node.key) < 2) {
+	    return parts (node);
+	}
+	let name = names.get (node.key);
+	if (name == undefined) {
+	    name = `_cse${names.size + 1}`;
+	    names.set (node.key, name);
+	    return `(${name} := ${parts (node)})`;
+	}
+	return name;
+    };
+    return parts (root);
+}
@@ -0,0 +1,60 @@
+"""Tests of the pure-Python parts of gridc.py, which need no t2t worker"""
+import gridc
+
+
+TWO_TESTS = "' ---- Test 1: one\n[A1] := 1\n\n' ---- Test 2: two\n[A1] := 2\n"
+
+
+def test_split_blocks_cuts_in_front_of_every_header():
+    blocks = gridc.split_blocks(TWO_TESTS)
+    assert blocks == ["' ---- Test 1: one\n[A1] := 1\n\n", "' ---- Test 2: two\n[A1] := 2\n"]
+    assert "".join(blocks) == TWO_TESTS
+
+
+def test_split_blocks_keeps_text_ahead_of_the_first_header():
+    src = "[A1] := 0\n" + TWO_TESTS
+    blocks = gridc.split_blocks(src)
+    assert blocks[0] == "[A1] := 0\n" and len(blocks) == 3
+    assert gridc.split_blocks("[A1] := 0\n") == ["[A1] := 0\n"]
+    assert gridc.split_blocks("") == []
+
+
+def test_renumber_shifts_line_markers():
+    assert gridc.renumber("a ⎩1⎭b ⎩12⎭", 10) == "a ⎩11⎭b ⎩22⎭"
+    assert gridc.renumber("a ⎩1⎭", 0) == "a ⎩1⎭"
+
+
+def test_a_file_of_test_blocks_compiles_block_by_block(monkeypatch):
+    compiler = object.__new__(gridc.Compiler)
+    compiler.stages = gridc.STAGES
+    calls = []
+    monkeypatch.setattr(compiler, "compile_sharded",
+                        lambda src, dump, incremental: calls.append(("sharded", incremental)) or "")
+    monkeypatch.setattr(compiler, "compile_program", lambda src, dump: calls.append(("program",)) or "")
+    compiler.compile(TWO_TESTS)
+    compiler.compile("[A1] := 1\n")
+    compiler.stages = gridc.IR_STAGES
+    compiler.compile(TWO_TESTS)
+    assert calls == [("sharded", False), ("program",), ("program",)]
+
+
+def test_indenter_turns_brackets_into_indentation():
+    text = "def f ():⤷\nif x:⤷\nreturn 1⤶\nreturn 2⤶\nf ()"
+    assert gridc.indent(text) == "\ndef f ():\n    if x:\n        return 1\n    return 2\nf ()"
+
+
+def test_indenter_fed_in_pieces_gives_the_same_text():
+    text = "def f ():⤷\nreturn 1⤶\nf ()\n"
+    indenter = gridc.Indenter()
+    pieces = [indenter.feed(text[i:i + 3]) for i in range(0, len(text), 3)]
+    assert "".join(pieces) + indenter.close() == gridc.indent(text)
+    assert gridc.Indenter().close() == ""
+
+
+def test_indenter_ignores_an_unbalanced_close():
+    assert gridc.indent("a⤶\nb⤷\nc") == "\na\nb\n    c"
+
+
+def test_top_level_statements():
+    python = "slots = 1\ndef f ():\n    return 1\n\nx = 2"
+    assert gridc.top_level_statements(python) == ["slots = 1", "def f ():\n    return 1\n", "x = 2"]
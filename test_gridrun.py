@@ -0,0 +1,52 @@
+"""Tests of gridrun.py's bytecode cache"""
+import os
+
+import gridrun
+import rtlib
+
+PROGRAM = """import rtlib
+subject = rtlib.fresh ()
+slots = rtlib.frame (subject, 0, ["n"])
+rtlib.input (subject, 0, "number")
+rtlib.cell (subject, 1 << 32 | 1, (0,), lambda: slots [0] * 2)
+rtlib.recalc (subject)
+"""
+
+
+def test_code_is_compiled_once_and_reused_from_disk(tmp_path):
+    cache = gridrun.BytecodeCache(tmp_path)
+    code = cache.code(PROGRAM)
+    assert (cache.hits, cache.misses) == (0, 1)
+    assert cache.code(PROGRAM) is code and cache.hits == 1
+    entries = list(cache.dir.iterdir())
+    assert [p.name for p in entries] == [f"{gridrun.bytecode_key(PROGRAM)}.marshal"]
+    again = gridrun.BytecodeCache(tmp_path)
+    assert again.code(PROGRAM).co_code == code.co_code
+    assert (again.hits, again.misses) == (1, 0)
+
+
+def test_key_follows_the_source():
+    assert gridrun.bytecode_key(PROGRAM) == gridrun.bytecode_key(PROGRAM)
+    assert gridrun.bytecode_key(PROGRAM) != gridrun.bytecode_key(PROGRAM + "\n")
+
+
+def test_a_damaged_entry_is_compiled_again(tmp_path):
+    cache = gridrun.BytecodeCache(tmp_path)
+    (cache.dir / f"{gridrun.bytecode_key(PROGRAM)}.marshal").write_bytes(b"\x00junk")
+    cache.code(PROGRAM)
+    assert cache.misses == 1
+    assert not [p for p in cache.dir.iterdir() if p.name.endswith(".partial")]
+
+
+def test_partial_file_is_private_to_the_process(tmp_path, monkeypatch):
+    written = []
+    real = os.replace
+    monkeypatch.setattr(gridrun.os, "replace", lambda a, b: written.append(a.name) or real(a, b))
+    gridrun.BytecodeCache(tmp_path).code(PROGRAM)
+    assert written == [f"{gridrun.bytecode_key(PROGRAM)}.marshal.{os.getpid()}.partial"]
+
+
+def test_run_passes_the_arguments(tmp_path, monkeypatch):
+    monkeypatch.setattr(rtlib, "arguments", [])
+    namespace = gridrun.BytecodeCache(tmp_path).run(PROGRAM, arguments=["21"])
+    assert rtlib.export(namespace["subject"]) == {"A1": 42.0}
@@ -0,0 +1,498 @@
+"""Tests of the runtime (rtlib.py) on its own, without the compiler
+
+Programs are written the way gridc.py emits them: a frame, then nodes
+registered with formula / cell / cellat / cellblock / spill, then recalc.
+"""
+import random
+
+import pytest
+
+import rtlib
+
+
+def key(column, row):
+    return column << 32 | row
+
+
+def program(names=()):
+    subject = rtlib.fresh()
+    return subject, rtlib.frame(subject, 0, list(names))
+
+
+# dependency graph, recalc and change
+
+def test_recalc_evaluates_in_dependency_order():
+    subject, slots = program(["a", "b", "c"])
+    # c reads b before b is defined (a forward reference)
+    rtlib.formula(subject, 2, (1,), lambda: slots[1] * 2)
+    rtlib.formula(subject, 0, (), lambda: 5)
+    rtlib.formula(subject, 1, (0,), lambda: slots[0] + 1)
+    rtlib.recalc(subject)
+    assert slots == [5, 6, 12]
+
+
+def test_change_recomputes_only_dependents():
+    subject, slots = program(["a", "b", "c", "d"])
+    calls = []
+
+    def node(name, compute):
+        def run():
+            calls.append(name)
+            return compute()
+        return run
+    rtlib.formula(subject, 0, (), node("a", lambda: 1))
+    rtlib.formula(subject, 1, (0,), node("b", lambda: slots[0] + 1))
+    rtlib.formula(subject, 2, (), node("c", lambda: 10))
+    rtlib.formula(subject, 3, (1, 2), node("d", lambda: slots[1] + slots[2]))
+    rtlib.recalc(subject)
+    calls.clear()
+    assert rtlib.change(subject, "a", 2) == 3
+    assert calls == ["b", "d"]
+    assert slots[3] == 13
+
+
+def test_change_stops_where_a_value_does_not_change():
+    subject, slots = program(["a", "b", "c"])
+    rtlib.formula(subject, 0, (), lambda: 1)
+    rtlib.formula(subject, 1, (0,), lambda: slots[0] > 0)
+    rtlib.formula(subject, 2, (1,), lambda: [slots[1]])
+    rtlib.recalc(subject)
+    # b stays True, so c is not recomputed
+    assert rtlib.change(subject, "a", 7) == 2
+
+
+def test_redefinition_is_seen_by_later_readers_only():
+    subject, slots = program(["x", "y", "z"])
+    rtlib.formula(subject, 0, (), lambda: 1)
+    rtlib.formula(subject, 1, (0,), lambda: slots[0] + 10)
+    rtlib.formula(subject, 0, (), lambda: 2)
+    rtlib.formula(subject, 2, (0,), lambda: slots[0] + 100)
+    rtlib.recalc(subject)
+    assert slots[1] == 11 and slots[2] == 102 and slots[0] == 2
+
+
+def test_circular_definition_is_reported():
+    subject, slots = program(["x", "y"])
+    rtlib.formula(subject, 0, (1,), lambda: slots[1])
+    rtlib.formula(subject, 1, (0,), lambda: slots[0])
+    with pytest.raises(RuntimeError, match="circular definition of x, y"):
+        rtlib.recalc(subject)
+
+
+def test_effects_keep_their_order(capsys):
+    subject, slots = program(["a"])
+    rtlib.effect(subject, (0,), lambda: print(slots[0]))
+    rtlib.effect(subject, (), lambda: print("second"))
+    rtlib.formula(subject, 0, (), lambda: "first")
+    rtlib.recalc(subject)
+    assert capsys.readouterr().out == "first\nsecond\n"
+
+
+# cells read at run time
+
+def test_cell_reads_follow_writes():
+    subject, slots = program()
+    rtlib.cell(subject, key(1, 2), (~key(1, 1),), lambda: rtlib.read(subject, key(1, 1)) + 1)
+    rtlib.cell(subject, key(1, 1), (), lambda: 41)
+    rtlib.recalc(subject)
+    assert rtlib.export(subject) == {"A1": 41, "A2": 42}
+
+
+def test_interpolated_cell_moves_and_its_reader_follows():
+    subject, slots = program(["n"])
+    rtlib.formula(subject, 0, (), lambda: 2)
+    rtlib.cellat(subject, (0,), lambda: rtlib.address(1, slots[0]), lambda: 33)
+    # B1 reads whichever row n points at
+    rtlib.cell(subject, key(2, 1), (0,), lambda: rtlib.read(subject, rtlib.address(1, slots[0])))
+    rtlib.recalc(subject)
+    assert rtlib.export(subject) == {"A2": 33, "B1": 33}
+    rtlib.change(subject, "n", 3)
+    assert rtlib.export(subject) == {"A3": 33, "B1": 33}
+
+
+def test_address_rejects_bad_coordinates():
+    with pytest.raises(ValueError):
+        rtlib.address(0, 1)
+    with pytest.raises(ValueError):
+        rtlib.address(1, 2.5)
+    assert rtlib.address(2, 3) == key(2, 3)
+
+
+# the cell store
+
+def test_cellstore_goes_dense_and_keeps_its_count():
+    store = rtlib.CellStore()
+    for row in range(1, 201):
+        store[key(3, row)] = row
+    chunk = store.chunks[key(3, 1) >> 10]
+    assert type(chunk) is list
+    assert len(store) == 200
+    assert store.pop(key(3, 5)) == 5
+    assert key(3, 5) not in store and len(store) == 199
+    store[key(3, 5)] = "back"
+    assert store[key(3, 5)] == "back" and len(store) == 200
+    assert dict(store.items())[key(3, 200)] == 200
+
+
+def test_cellstore_sparse_missing_and_delete():
+    store = rtlib.CellStore()
+    store[key(1, 1)] = 1
+    store[key(1, 1 << 20)] = 2
+    assert store.get(key(1, 2)) is None
+    with pytest.raises(KeyError):
+        store[key(1, 2)]
+    del store[key(1, 1)]
+    assert list(store.items()) == [(key(1, 1 << 20), 2)]
+
+
+def test_column_totals_are_exact():
+    store = rtlib.CellStore()
+    store[key(1, 1)] = 1e16
+    store[key(1, 2)] = 1
+    store[key(1, 3)] = 1
+    assert store.total(key(1, 2), key(1, 3)) == (2, 2)
+    assert store.total(key(1, 1), key(1, 3)) == (1e16 + 2, 3)
+    store[key(1, 4)] = 0.1
+    store[key(1, 5)] = 0.2
+    assert store.total(key(1, 4), key(1, 5))[0] == 0.30000000000000004
+
+
+def test_column_totals_forget_an_overwritten_inf():
+    store = rtlib.CellStore()
+    store[key(1, 1)] = 5
+    store.total(key(1, 1), key(1, 2))
+    store[key(1, 2)] = float("inf")
+    assert store.total(key(1, 1), key(1, 2)) == (float("inf"), 2)
+    store[key(1, 2)] = 7
+    assert store.total(key(1, 1), key(1, 2)) == (12, 2)
+
+
+def test_column_totals_stay_ints_after_a_float_is_gone():
+    store = rtlib.CellStore()
+    store.total(key(1, 1), key(1, 1))
+    store[key(1, 1)] = 2.5
+    store[key(1, 1)] = 3
+    total, count = store.total(key(1, 1), key(1, 1))
+    assert type(total) is int and total == 3 and count == 1
+    del store[key(1, 1)]
+    assert store.total(key(1, 1), key(1, 1)) == (0, 0)
+
+
+def test_column_totals_are_built_from_that_column_only():
+    store = rtlib.CellStore()
+    store[key(1, 1)] = 1
+    store[key(1, 5000)] = 2
+    store[key(2, 1)] = 40
+    store[key(2, 1 << 20)] = 50
+    assert store.columns[1] == [key(1, 1) >> 10, key(1, 5000) >> 10]
+    assert store.total(key(1, 1), key(1, 1 << 20)) == (3, 2)
+    assert store.total(key(2, 1), key(2, 1 << 20)) == (90, 2)
+
+
+def test_cellname():
+    assert rtlib.cellname(key(1, 1)) == "A1"
+    assert rtlib.cellname(key(28, 2)) == "AB2"
+
+
+# ranges and block assignment
+
+def test_range_is_a_view_of_the_current_cells():
+    subject, slots = program()
+    subject.cells[key(1, 1)] = 1
+    view = rtlib.cellrange(subject, key(2, 2), key(1, 1))
+    assert view.shape == (2, 2)
+    subject.cells[key(2, 2)] = 4
+    assert view.values() == [1, None, None, 4]
+
+
+def test_range_reader_is_recomputed_when_a_covered_cell_changes():
+    subject, slots = program(["a"])
+    total = rtlib.builtin("sum")
+    rtlib.cell(subject, key(2, 1), (), lambda: total(rtlib.cellrange(subject, key(1, 1), key(1, 3))))
+    rtlib.formula(subject, 0, (), lambda: 1)
+    rtlib.cell(subject, key(1, 2), (0,), lambda: slots[0])
+    rtlib.recalc(subject)
+    assert rtlib.export(subject)["B1"] == 1
+    rtlib.change(subject, "a", 5)
+    assert rtlib.export(subject)["B1"] == 5
+
+
+def test_watchers_find_the_spans_holding_a_row():
+    rnd = random.Random(23)
+    watchers = rtlib.Watchers()
+    spans = {}
+    for n in range(200):
+        r1 = rnd.randrange(1, 5000)
+        r2 = r1 + rnd.choice([0, 1, 7, 100, 3000])
+        spans[n] = (r1, r2)
+        watchers.watch(n, key(1, r1), key(2, r2))
+    for n in range(0, 200, 3):
+        watchers.forget(n)
+        del spans[n]
+    for row in [1, 2, 99, 100, 101, 2500, 4999, 5000, 8000, 9000]:
+        expected = {n for n, (r1, r2) in spans.items() if r1 <= row <= r2}
+        assert watchers.readers(key(1, row)) == expected
+        assert watchers.readers(key(2, row)) == expected
+        assert not watchers.readers(key(3, row))
+    for n in list(spans):
+        watchers.forget(n)
+    assert watchers.spans == {} and watchers.watching == {}
+
+
+def test_block_copies_a_range():
+    subject, slots = program()
+    rtlib.cellblock(subject, (), key(2, 1), key(2, 2), lambda: rtlib.cellrange(subject, key(1, 2), key(1, 3)))
+    for row in (1, 2, 3):
+        rtlib.cell(subject, key(1, row), (), (lambda row: lambda: row)(row))
+    rtlib.recalc(subject)
+    assert rtlib.export(subject) == {"A1": 1, "A2": 2, "A3": 3, "B1": 2, "B2": 3}
+
+
+def test_block_from_an_overlapping_range_copies_first():
+    subject, slots = program()
+    for row in (1, 2, 3):
+        subject.cells[key(1, row)] = row * 10
+    rtlib.cellblock(subject, (), key(1, 2), key(1, 4), lambda: rtlib.cellrange(subject, key(1, 1), key(1, 3)))
+    rtlib.recalc(subject)
+    assert rtlib.export(subject) == {"A1": 10, "A2": 10, "A3": 20, "A4": 30}
+
+
+def test_block_rejects_a_value_of_another_shape():
+    subject, slots = program()
+    rtlib.cellblock(subject, (), key(1, 1), key(1, 2), lambda: rtlib.array([[1, 2, 3]]))
+    with pytest.raises(ValueError, match="does not fit A1:A2"):
+        rtlib.recalc(subject)
+
+
+def test_push_copies_a_range():
+    subject, slots = program(["r"])
+    subject.cells[key(1, 1)] = 1
+    rtlib.push(subject, 0, rtlib.cellrange(subject, key(1, 1), key(1, 2)))
+    subject.cells[key(1, 1)] = 99
+    assert slots[0].tolist() == [[1.0], [0.0]]
+
+
+# builtins
+
+def test_builtins_dispatch_by_shape():
+    sqrt = rtlib.builtin("sqrt")
+    assert sqrt(100) == 10.0
+    assert sqrt(rtlib.array([[4, 9]])).tolist() == [[2.0, 3.0]]
+    subject, slots = program()
+    subject.cells[key(1, 1)] = 16
+    assert sqrt(rtlib.cellrange(subject, key(1, 1), key(1, 2))).tolist() == [[4.0], [0.0]]
+    assert rtlib.builtin("len")("abcd") == 4
+    with pytest.raises(NameError):
+        rtlib.builtin("nosuchfunction")
+
+
+def test_only_registered_functions_are_builtins():
+    with pytest.raises(NameError):
+        rtlib.builtin("print")
+
+
+def test_ir_resolves_builtins_for_calls_only():
+    names = ['const "abc"', 'name "len"', 'name "n"']
+    call = rtlib.runir("\n".join(["gridir 1", "mark", "k 0", "call 0", "st 1"] + names))
+    assert call.slots[1] == 3
+    with pytest.raises(NameError, match="'len' is not defined"):
+        rtlib.runir("\n".join(["gridir 1", "ld 0", "st 1"] + names))
+
+
+# arrays without numpy give what numpy gives
+
+EDGES = [0.0, -0.0, 1.0, -1.0, -2.0, 0.5, 400.0, 401.0]
+
+
+def listarray(values):
+    return rtlib.Array([float(x) for x in values], (1, len(values)))
+
+
+@pytest.mark.parametrize("name", ["div", "idiv", "mod", "pow"])
+def test_list_path_edge_cases(name, monkeypatch):
+    monkeypatch.setattr(rtlib, "_np", None)
+    xs = [x for x in EDGES for y in EDGES] + [-8.0, -10.0]
+    ys = [y for x in EDGES for y in EDGES] + [1 / 3, 401.0]
+    r = rtlib._binary(name, listarray(xs), listarray(ys))
+    assert type(r.data) is list
+    for x, y, got in zip(xs, ys, r.data):
+        assert type(got) is float, (x, y, got)
+    np = pytest.importorskip("numpy")
+    with np.errstate(all="ignore"):
+        want = getattr(np, rtlib._kernels[name][0])(np.array(xs), np.array(ys))
+    for x, y, got, expected in zip(xs, ys, r.data, want.tolist()):
+        assert repr(got) == repr(expected), (x, y)
+
+
+def test_list_path_zero_divisors(monkeypatch):
+    monkeypatch.setattr(rtlib, "_np", None)
+    x = listarray([1.0, -1.0, 0.0, -0.0])
+    inf = float("inf")
+    assert (x / 0.0).flat()[:2] == [inf, -inf]
+    assert all(v != v for v in (x / 0.0).flat()[2:])
+    assert (x / -0.0).tolist()[0][:2] == [-inf, inf]
+    assert (x // 0.0).tolist()[0][:2] == [inf, -inf]
+    assert all(v != v for v in (x % 0.0).flat())
+    assert (0.0 ** listarray([-1.0, -2.0, 2.0])).tolist() == [[inf, inf, 0.0]]
+    assert ((-0.0) ** listarray([-1.0, -2.0])).tolist() == [[-inf, inf]]
+    root = (listarray([-8.0]) ** (1 / 3)).flat()[0]
+    assert type(root) is float and root != root
+    assert (listarray([10.0, -10.0]) ** 401.0).tolist() == [[inf, -inf]]
+
+
+# spills and the cells assigned explicitly
+
+SPILL_THEN_CELL = """gridir 1
+mark
+mark
+k 0
+k 1
+row
+mark
+k 2
+k 3
+row
+array
+k 0
+k 0
+spill
+line 1
+k 4
+k 1
+k 1
+stcell
+line 2
+const 1
+const 2
+const 3
+const 4
+const 9
+"""
+
+
+def test_spill_into_an_assigned_cell_is_refused():
+    for cell_first in (False, True):
+        subject, slots = program()
+        if cell_first:
+            rtlib.cell(subject, key(2, 2), (), lambda: 9)
+        rtlib.spill(subject, (), key(1, 1), lambda: rtlib.array([[1, 2], [3, 4]]))
+        if not cell_first:
+            rtlib.cell(subject, key(2, 2), (), lambda: 9)
+        with pytest.raises(ValueError, match="from A1 to B2 runs into B2"):
+            rtlib.recalc(subject)
+
+
+def test_ir_spill_into_an_assigned_cell_is_refused():
+    with pytest.raises(ValueError, match="B2 is in the spill from A1"):
+        rtlib.runir(SPILL_THEN_CELL)
+    # the cell first, then the spill
+    lines = SPILL_THEN_CELL.split("\n")
+    reordered = "\n".join(lines[:1] + lines[15:20] + lines[1:15] + lines[20:])
+    with pytest.raises(ValueError, match="from A1 to B2 runs into B2"):
+        rtlib.runir(reordered)
+
+
+def test_spill_moves_with_its_value_and_frees_what_it_left():
+    subject, slots = program(["n"])
+    rtlib.formula(subject, 0, (), lambda: 3)
+    rtlib.spill(subject, (0,), key(1, 1), lambda: rtlib.array([[x] for x in range(slots[0])]))
+    rtlib.recalc(subject)
+    assert rtlib.export(subject) == {"A1": 0.0, "A2": 1.0, "A3": 2.0}
+    rtlib.change(subject, "n", 1)
+    assert rtlib.export(subject) == {"A1": 0.0}
+    # A2 is free again
+    rtlib.cell(subject, key(1, 2), (), lambda: "x")
+    rtlib.recalc(subject)
+    assert rtlib.export(subject) == {"A1": 0.0, "A2": "x"}
+
+
+def test_spills_do_not_overlap():
+    subject, slots = program()
+    rtlib.spill(subject, (), key(1, 1), lambda: rtlib.array([[1, 2]]))
+    rtlib.spill(subject, (), key(2, 1), lambda: 5)
+    with pytest.raises(ValueError, match="runs into the spill from A1"):
+        rtlib.recalc(subject)
+
+
+def test_block_assignment_claims_its_cells_in_the_ir():
+    ir = "\n".join([
+        "gridir 1",
+        "k 0", "k 1", "k 1", "k 1", "k 1", "stblock",
+        "mark", "mark", "k 0", "k 0", "row", "array", "k 1", "k 1", "spill",
+        "const 7", "const 1",
+    ])
+    with pytest.raises(ValueError, match="from A1 to B1 runs into A1"):
+        rtlib.runir(ir)
+
+
+# Input
+
+def test_inputs_take_the_arguments_in_order(monkeypatch):
+    monkeypatch.setattr(rtlib, "arguments", ["5", "TOYO"])
+    subject, slots = program(["n", "make", "m"])
+    rtlib.input(subject, 0, "number")
+    rtlib.input(subject, 1, None)
+    rtlib.formula(subject, 2, (0,), lambda: slots[0] + 1)
+    rtlib.recalc(subject)
+    assert slots == [5.0, "TOYO", 6.0]
+
+
+def test_input_without_an_argument_or_of_the_wrong_type(monkeypatch):
+    monkeypatch.setattr(rtlib, "arguments", ["five"])
+    subject, slots = program(["n"])
+    with pytest.raises(TypeError, match="'five' is not a number"):
+        rtlib.input(subject, 0, "number")
+    subject, slots = program(["n"])
+    monkeypatch.setattr(rtlib, "arguments", [])
+    with pytest.raises(ValueError, match="no argument given for Input n"):
+        rtlib.input(subject, 0, None)
+
+
+def test_ir_input(monkeypatch):
+    monkeypatch.setattr(rtlib, "arguments", ["2.5"])
+    ir = "\n".join(["gridir 1", "input 0 0", "ld 0", "ld 0", "add", "st 1",
+                    'const "number"', 'name "x"', 'name "y"'])
+    assert rtlib.runir(ir).slots == [2.5, 5.0]
+
+
+# declared types
+
+def test_declared_type_is_checked_on_change_and_push():
+    subject, slots = program(["x", "y"])
+    rtlib.declare(subject, 0, "number")
+    rtlib.declare(subject, 1, None)
+    rtlib.formula(subject, 0, (), lambda: 1)
+    rtlib.recalc(subject)
+    rtlib.change(subject, "x", 2)
+    assert slots[0] == 2
+    with pytest.raises(TypeError, match="'two' is not a number"):
+        rtlib.change(subject, "x", "two")
+    with pytest.raises(TypeError):
+        rtlib.push(subject, 0, "three")
+    rtlib.push(subject, 1, "anything")
+    assert slots == [2, "anything"]
+
+
+def test_ir_declare_without_a_type():
+    ir = "\n".join(["gridir 1", "declare 0", "k 0", "push 0", "const \"x\"", "name \"x\""])
+    assert rtlib.runir(ir).slots == ["x"]
+    typed = "\n".join(["gridir 1", "declare 0 1", "k 0", "push 0", "const \"x\"", "const \"number\"", "name \"x\""])
+    with pytest.raises(TypeError, match="'x' is not a number"):
+        rtlib.runir(typed)
+
+
+def test_ir_check_guards_a_typed_store():
+    def run(value):
+        return rtlib.runir("\n".join(["gridir 1", "declare 0 1", "k 0", "check 1", "st 0",
+                                      f"const {value}", 'const "number"', 'name "x"']))
+    assert run("3").slots == [3]
+    with pytest.raises(TypeError, match="'x' is not a number"):
+        run('"x"')
+
+
+def test_ir_check_guards_a_typed_function_input():
+    ir = "\n".join(["gridir 1", "fn 1", "input 0 1", "ld 0", "check 1", "st 0", "end",
+                    "mark", "k 0", "call 1", "print",
+                    'const "x"', 'const "number"', 'name "x"', 'name "f"'])
+    with pytest.raises(TypeError, match="'x' is not a number"):
+        rtlib.runir(ir)
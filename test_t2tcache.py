@@ -0,0 +1,55 @@
+"""Tests of pbp/t2tcache.py: cache keys, lookups and the stats report"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "pbp"))
+import t2tcache
+
+
+def project(tmp_path):
+    lib = tmp_path / "pbp" / "t2td" / "lib"
+    lib.mkdir(parents=True)
+    for part in t2tcache.LIB_PARTS:
+        (lib / part).write_text(f"// {part}\n")
+    (tmp_path / "grid.ohm").write_text("grid { }\n")
+    (tmp_path / "grid.rwr").write_text("% rewrite grid { }\n")
+    (tmp_path / "support.mjs").write_text("// support\n")
+    return tmp_path, lib
+
+
+def key(pbpwd, lib):
+    return t2tcache.transpiler_key(pbpwd / "grid.ohm", pbpwd / "grid.rwr", pbpwd / "support.mjs", lib)
+
+
+def test_key_follows_the_contents_of_every_input(tmp_path):
+    pbpwd, lib = project(tmp_path)
+    first = key(pbpwd, lib)
+    assert key(pbpwd, lib) == first
+    for path in (pbpwd / "grid.ohm", pbpwd / "grid.rwr", pbpwd / "support.mjs", lib / "rwr.mjs"):
+        before = path.read_text()
+        path.write_text(before + " ")
+        assert key(pbpwd, lib) != first, path.name
+        path.write_text(before)
+    assert key(pbpwd, lib) == first
+
+
+def test_key_does_not_depend_on_where_the_project_is(tmp_path):
+    a, liba = project(tmp_path / "a")
+    b, libb = project(tmp_path / "b")
+    assert key(a, liba) == key(b, libb)
+
+
+def test_a_cached_transpiler_is_reused_and_counted(tmp_path):
+    pbpwd, lib = project(tmp_path)
+    target = t2tcache.cache_dir(pbpwd) / f"{key(pbpwd, lib)}.nanodsl.mjs"
+    target.write_text("// assembled\n")
+    # a hit never runs node
+    assert t2tcache.transpiler(pbpwd / "grid.ohm", pbpwd / "grid.rwr", pbpwd, pbpwd / "pbp") == target
+    t2tcache.record(pbpwd / t2tcache.CACHE_DIRNAME, "miss", "0" * 64, pbpwd / "grid.ohm", pbpwd / "grid.rwr")
+    report = t2tcache.stats(pbpwd).splitlines()
+    assert report[0] == "t2t cache: 2 lookups, 1 hits, 1 misses (50.0% hit), 1 entries"
+    assert report[1].split() == ["grid", "grid", "hits", "1", "misses", "1"]
+
+
+def test_stats_without_lookups(tmp_path):
+    assert t2tcache.stats(tmp_path) == "t2t cache: no lookups recorded"
@@ -0,0 +1,170 @@
+"""Tests of pbp/t2tworker.py with stand-ins for the node worker"""
+import io
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "pbp"))
+import t2tworker
+
+
+def replying(*replies):
+    """A Connection whose worker answers with replies, one per request"""
+    rfile = io.StringIO("".join(json.dumps(reply) + "\n" for reply in replies))
+    return t2tworker.Connection(rfile, io.StringIO())
+
+
+def test_request_frames_one_json_object_per_line():
+    connection = replying({"id": 1, "ok": True, "out": "x = 1"})
+    assert connection.transform("grid.nanodsl.mjs", "[A1] := 1", reset=False) == "x = 1"
+    sent = json.loads(connection.wfile.getvalue())
+    assert sent["id"] == 1 and sent["src"] == "[A1] := 1" and sent["reset"] is False
+    assert sent["transpiler"] == str(Path("grid.nanodsl.mjs").resolve())
+
+
+def test_a_failed_request_raises_the_workers_message():
+    connection = replying({"id": 1, "ok": False, "error": "Line 3: expected End", "parse": True, "position": 17})
+    with pytest.raises(t2tworker.WorkerError, match="expected End") as raised:
+        connection.request(op="stats")
+    assert raised.value.parse and raised.value.position == 17
+
+
+def test_a_closed_worker_is_a_connection_error():
+    with pytest.raises(ConnectionError):
+        replying().request(op="stats")
+
+
+def test_socket_path_can_be_overridden(monkeypatch, tmp_path):
+    monkeypatch.delenv("T2TD_SOCKET", raising=False)
+    assert t2tworker.socket_path(tmp_path) == tmp_path / ".t2tcache" / "t2td.sock"
+    monkeypatch.setenv("T2TD_SOCKET", "/tmp/elsewhere.sock")
+    assert t2tworker.socket_path(tmp_path) == Path("/tmp/elsewhere.sock")
+    monkeypatch.delenv("T2TD_SOCKET")
+    assert t2tworker.connect(tmp_path) is None
+
+
+class Transpiler:
+    """Stands in for a worker: upper-cases its input, fails to parse one
+    that stops inside Define ... End (at its end) or holds a line "bad" (there)"""
+
+    def __init__(self, position=True):
+        self.calls = []
+        self.position = position
+
+    def transform(self, transpiler, src, reset=True):
+        self.calls.append((src, reset))
+        if "bad\n" in src:
+            at = src.index("bad\n")
+        elif src.count("Define") > src.count("End"):
+            at = len(src)
+        else:
+            return src.upper()
+        raise t2tworker.WorkerError("syntax error", parse=True,
+                                    position=t2tworker.utf16_length(src[:at]) if self.position else None)
+
+
+def stream_all(stream, text, piece=7):
+    out = [stream.feed(text[i:i + piece]) for i in range(0, len(text), piece)]
+    return "".join(out) + stream.close()
+
+
+def test_stream_output_equals_the_whole_output():
+    worker = Transpiler()
+    text = "".join(f"[A{i}] := {i}\n" for i in range(1, 40))
+    stream = t2tworker.Stream(worker, "grid", chunk=50)
+    assert stream_all(stream, text) == text.upper() + "\n"
+    assert len(worker.calls) > 2
+    assert [reset for _, reset in worker.calls] == [True] + [False] * (len(worker.calls) - 1)
+    assert all(len(src) < 100 for src, _ in worker.calls)
+
+
+def test_stream_waits_for_a_statement_cut_by_a_boundary():
+    worker = Transpiler()
+    text = "a\n" * 10 + "Define f\n" + "x\n" * 30 + "End f\n" + "b\n" * 10
+    assert stream_all(t2tworker.Stream(worker, "grid", chunk=16), text) == text.upper() + "\n"
+
+
+def test_stream_raises_a_real_syntax_error_before_the_end():
+    worker = Transpiler()
+    text = "a\n" * 10 + "bad\n" + "b\n" * 200
+    with pytest.raises(t2tworker.WorkerError):
+        stream_all(t2tworker.Stream(worker, "grid", chunk=16), text)
+    # after the first failure the text is not buffered to the end
+    assert max(len(src) for src, _ in worker.calls) < 80
+
+
+def test_stream_gives_up_after_retries_without_a_position():
+    worker = Transpiler(position=False)
+    text = "bad\n" + "b\n" * 5000
+    with pytest.raises(t2tworker.WorkerError):
+        stream_all(t2tworker.Stream(worker, "grid", chunk=4), text)
+    assert len(worker.calls) == t2tworker.RETRIES + 1
+
+
+def test_source_boundary_does_not_cut_inside_a_string():
+    cut = t2tworker.source_boundary()
+    assert cut('[A1] := "two\n') is False
+    assert cut('lines" \' a "comment\n') is True
+    assert cut("[A2] := 1\n") is True
+
+
+def test_eol_boundary_cuts_after_a_line_marker():
+    cut = t2tworker.eol_boundary()
+    assert cut("[❲a1❳] := 1⎩3⎭\n") is True
+    assert cut("Define ❲f❳ as\n") is False
+
+
+@pytest.mark.parametrize("old, new, expected", [
+    ("", "abc", (0, 0, "abc")),
+    ("abc", "", (0, 3, "")),
+    ("abc", "abc", (3, 3, "")),
+    ("abcdef", "abXYef", (2, 4, "XY")),
+    ("aaaa", "aaaaa", (4, 4, "a")),
+    ("[A1] := 1\n", "[A1] := 12\n", (9, 9, "2")),
+])
+def test_edit_range_strips_the_common_prefix_and_suffix(old, new, expected):
+    start, end, text = t2tworker.edit_range(old, new)
+    assert (start, end, text) == expected
+    assert old[:start] + text + old[end:] == new
+
+
+def test_utf16_length_counts_code_units():
+    assert t2tworker.utf16_length("a⎩1⎭") == 4
+    assert t2tworker.utf16_length("😀") == 2
+
+
+class Matcher:
+    """Stands in for a worker's sessions, applying edits to its own copy"""
+
+    def __init__(self):
+        self.texts = {}
+        self.requests = []
+
+    def request(self, **fields):
+        self.requests.append(fields)
+        if fields["op"] == "open":
+            self.texts[fields["session"]] = ""
+            return {"ok": True}
+        if fields["op"] == "edit":
+            units = self.texts[fields["session"]].encode("utf-16-le")
+            text = (units[:2 * fields["start"]] + fields["text"].encode("utf-16-le") +
+                    units[2 * fields["end"]:]).decode("utf-16-le")
+            self.texts[fields["session"]] = text
+            return {"ok": True, "out": text.upper(), "rewritten": 1, "reused": 2}
+        return {"ok": True}
+
+
+def test_session_sends_only_the_edited_range():
+    worker = Matcher()
+    session = t2tworker.Session(worker, "grid", "grid.nanodsl.mjs", ("TopLevelStatement",))
+    assert worker.requests[0]["memo"] == ["TopLevelStatement"]
+    assert session.update("😀 [A1] := 1\n[A2] := 2\n") == "😀 [A1] := 1\n[A2] := 2\n"
+    assert session.update("😀 [A1] := 10\n[A2] := 2\n") == "😀 [A1] := 10\n[A2] := 2\n"
+    edit = worker.requests[-1]
+    assert (edit["start"], edit["end"], edit["text"]) == (12, 12, "0")
+    assert (session.rewritten, session.reused) == (1, 2)
+    requests = len(worker.requests)
+    session.update("😀 [A1] := 10\n[A2] := 2\n")
+    assert len(worker.requests) == requests and session.rewritten == 0